@@ -0,0 +1,24 @@
+// service_planner socket.io handlers (loaded by Frappe's realtime server for each installed app)
+
+// Rooms for "service_task_delta": the server decides which ones the user may join
+const TASK_DELTA_ROOMS_METHOD =
+    "/api/method/service_planner.server_script.task_notifications.get_task_delta_rooms";
+
+function service_planner_handlers(...args) {
+    // Frappe passes (socket) or (realtime, socket) depending on the version
+    const socket = args[args.length - 1];
+
+    socket.on("service_planner:task_delta_subscribe", () => {
+        socket
+            .frappe_request(TASK_DELTA_ROOMS_METHOD)
+            .then((res) => res.json())
+            .then(({ message }) => {
+                (message || []).forEach((room) => socket.join(room));
+            })
+            .catch((e) => {
+                console.log("service_planner: task delta subscription failed", e.message);
+            });
+    });
+}
+
+module.exports = service_planner_handlers;
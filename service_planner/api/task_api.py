@@ -2,16 +2,55 @@
 
 import frappe
 from frappe import _
-from frappe.utils import nowdate, getdate, add_days, add_months, format_datetime, formatdate
+from frappe.utils import nowdate, getdate, add_days, add_months, cint, format_datetime, formatdate
 from typing import Dict, List, Optional, Union
 from datetime import datetime
+import base64
+import hashlib
 import pytz
 import json
 
+from service_planner.utils.role_index import get_user_info, get_user_roles
+from service_planner.utils.task_search import (
+    DEFAULT_SUGGESTION_LIMIT, MAX_SUGGESTION_LIMIT, get_match_expression, get_search_condition,
+    matches_search
+)
+from service_planner.utils.task_stats import EMPTY_STATS, get_cached_task_stats, invalidate_task_stats
+from service_planner.utils.timezone_utils import tz_manager
+from service_planner.server_script.virtual_tasks import (
+    DEFAULT_VIRTUAL_WINDOW_DAYS, get_virtual_task, get_virtual_tasks, is_virtual_task,
+    materialize_virtual_task
+)
+
+# Page size of get_my_tasks
+DEFAULT_PAGE_LENGTH = 50
+MAX_PAGE_LENGTH = 500
+
+# Fixed queries, shared with utils.index_check
+UPCOMING_TASKS_QUERY = """
+    SELECT name, task_title, due_date, status
+    FROM `tabService Task`
+    WHERE due_date >= %s
+    AND status != 'Completed'
+    ORDER BY due_date ASC
+    LIMIT 5
+"""
+
+USER_STATS_QUERY = """
+    SELECT 
+        COUNT(*) as total_assigned,
+        SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed,
+        SUM(CASE WHEN status = 'Completed' AND due_date >= modified THEN 1 ELSE 0 END) as on_time,
+        SUM(CASE WHEN status = 'Completed' AND due_date < modified THEN 1 ELSE 0 END) as late,
+        SUM(CASE WHEN status != 'Completed' AND due_date < %s THEN 1 ELSE 0 END) as overdue
+    FROM `tabService Task`
+    WHERE assigned_to = %s
+"""
+
 class TaskAPI:
-    def __init__(self):
-        self.current_user = frappe.session.user
-        self.user_roles = frappe.get_roles(self.current_user)
+    def __init__(self, user=None):
+        self.current_user = user or frappe.session.user
+        self.user_roles = get_user_roles(self.current_user)
         self.is_admin = self._check_if_admin()
 
     def _check_if_admin(self) -> bool:
@@ -33,6 +72,7 @@ class TaskAPI:
             "creation": task.get("creation") or (task.creation if hasattr(task, 'creation') else None),
             "modified": task.get("modified") or (task.modified if hasattr(task, 'modified') else None),
             "parent": task.get("parent") or (task.parent if hasattr(task, 'parent') else None),
+            "is_virtual": 1 if task.get("is_virtual") else 0,
             "can_edit": self._can_edit_task(task)
         }
         
@@ -78,120 +118,258 @@ class TaskAPI:
             
         return False
 
-    def get_task_stats(self, base_filters: Dict = None) -> Dict:
-        """الحصول على إحصائيات المهام"""
-        try:
-            if base_filters is None:
-                base_filters = {}
-
-            # إجمالي المهام
-            total = frappe.db.count('Service Task', filters=base_filters)
-
-            # المهام المكتملة
-            completed_filters = base_filters.copy()
-            completed_filters['status'] = 'Completed'
-            completed = frappe.db.count('Service Task', filters=completed_filters)
-
-            # المهام قيد التنفيذ
-            in_progress_filters = base_filters.copy()
-            in_progress_filters['status'] = 'In Progress'
-            in_progress = frappe.db.count('Service Task', filters=in_progress_filters)
-
-            # المهام المتأخرة
-            overdue_filters = base_filters.copy()
-            overdue_filters['due_date'] = ['<', nowdate()]
-            overdue_filters['status'] = ['!=', 'Completed']
-            overdue = frappe.db.count('Service Task', filters=overdue_filters)
-
-            # المهام قيد الانتظار
-            pending_filters = base_filters.copy()
-            pending_filters['status'] = 'Pending'
-            pending = frappe.db.count('Service Task', filters=pending_filters)
-
-            return {
-                "success": True,
-                "stats": {
-                    "total": total,
-                    "completed": completed,
-                    "in_progress": in_progress,
-                    "pending": pending,
-                    "overdue": overdue
-                }
-            }
-        except Exception as e:
-            frappe.log_error(f"Error in get_task_stats: {str(e)}")
-            return {"success": False, "error": str(e)}
+    def get_filter_conditions(self, status=None, due_filter=None) -> List[str]:
+        """شروط النطاق والحالة والتاريخ (بدون البحث)"""
+        conditions = []
 
-@frappe.whitelist()
-def get_my_tasks(status=None, due_filter=None, search_term=None):
-    """الحصول على المهام الخاصة بالمستخدم مع الترجمات"""
-    try:
-        task_api = TaskAPI()
-        
-        # بناء شرط WHERE clause
-        where_conditions = []
-        
         # فلتر المستخدم: إذا لم يكن مدير نظام
-        if not task_api.is_admin:
-            # بناء شرط صلاحيات المستخدم
-            user_condition = f"assigned_to = {frappe.db.escape(task_api.current_user)}"
-            
-            # بناء شرط الأدوار
-            role_conditions = []
-            if task_api.user_roles:
-                for role in task_api.user_roles:
-                    role_conditions.append(f"assigned_role = {frappe.db.escape(role)}")
-            
-            # دمج الشروط مع التأكد من أن المهام المسندة لشخص محدد لا تظهر للآخرين
-            if role_conditions:
-                role_condition = f"({' OR '.join(role_conditions)}) AND assigned_to IS NULL"
-                user_role_condition = f"({user_condition} OR {role_condition})"
-            else:
-                user_role_condition = user_condition
-            
-            where_conditions.append(user_role_condition)
-        
+        scope_condition = self.get_scope_condition()
+        if scope_condition:
+            conditions.append(scope_condition)
+
         # فلتر الحالة
         if status and status != 'All':
-            where_conditions.append(f"status = {frappe.db.escape(status)}")
-            
+            conditions.append(f"status = {frappe.db.escape(status)}")
+
         # فلتر التاريخ
         if due_filter and due_filter != 'all':
             today = nowdate()
-            
+
             if due_filter == "today":
-                where_conditions.append(f"due_date = {frappe.db.escape(today)}")
+                conditions.append(f"due_date = {frappe.db.escape(today)}")
             elif due_filter == "week":
                 week_end = add_days(today, 7)
-                where_conditions.append(f"due_date BETWEEN {frappe.db.escape(today)} AND {frappe.db.escape(week_end)}")
+                conditions.append(f"due_date BETWEEN {frappe.db.escape(today)} AND {frappe.db.escape(week_end)}")
             elif due_filter == "month":
                 month_end = add_months(today, 1)
-                where_conditions.append(f"due_date BETWEEN {frappe.db.escape(today)} AND {frappe.db.escape(month_end)}")
+                conditions.append(f"due_date BETWEEN {frappe.db.escape(today)} AND {frappe.db.escape(month_end)}")
             elif due_filter == "overdue":
-                where_conditions.append(f"due_date < {frappe.db.escape(today)}")
-                where_conditions.append("status != 'Completed'")
-        
-        # فلتر البحث
-        if search_term:
-            search_escaped = frappe.db.escape(f"%{search_term}%")
-            where_conditions.append(f"(task_title LIKE {search_escaped} OR notes LIKE {search_escaped})")
-        
-        # بناء الاستعلام النهائي
-        where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-        
-        sql_query = f"""
+                conditions.append(f"due_date < {frappe.db.escape(today)}")
+                conditions.append("status != 'Completed'")
+
+        return conditions
+
+    def get_task_stats(self, status=None, due_filter=None) -> Dict:
+        """الحصول على إحصائيات المهام (من الذاكرة المؤقتة للمستخدم والفلتر)"""
+        try:
+            stats = get_cached_task_stats(
+                self.current_user, status, due_filter,
+                lambda: self._compute_task_stats(status, due_filter)
+            )
+            return {"success": True, "stats": stats}
+        except Exception as e:
+            frappe.log_error(f"Error in get_task_stats: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def _compute_task_stats(self, status=None, due_filter=None) -> Dict:
+        """استعلام تجميعي واحد لكل الإحصائيات"""
+        conditions = self.get_filter_conditions(status, due_filter)
+        stats_result = frappe.db.sql(f"""
             SELECT 
-                name, task_title, due_date, local_due_date,
-                assigned_to, assigned_role, status,
-                notes, creation, modified, parent
+                COUNT(*) as total,
+                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed,
+                SUM(CASE WHEN status = 'In Progress' THEN 1 ELSE 0 END) as in_progress,
+                SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END) as pending,
+                SUM(CASE WHEN due_date < {frappe.db.escape(nowdate())} AND status != 'Completed' THEN 1 ELSE 0 END) as overdue
             FROM `tabService Task`
-            WHERE {where_clause}
-            ORDER BY due_date ASC, creation DESC
+            WHERE {" AND ".join(conditions) if conditions else "1=1"}
+        """, as_dict=True)
+
+        # تحويل القيم إلى int للتأكد من التوافق
+        stats = dict(EMPTY_STATS)
+        if stats_result:
+            stats.update({key: int(value or 0) for key, value in stats_result[0].items()})
+        return stats
+
+    def get_scope_condition(self) -> Optional[str]:
+        """شرط SQL للمهام التي يراها المستخدم (None لمدير النظام)"""
+        if self.is_admin:
+            return None
+
+        # بناء شرط صلاحيات المستخدم
+        user_condition = f"assigned_to = {frappe.db.escape(self.current_user)}"
+
+        # بناء شرط الأدوار
+        role_conditions = []
+        if self.user_roles:
+            for role in self.user_roles:
+                role_conditions.append(f"assigned_role = {frappe.db.escape(role)}")
+
+        # دمج الشروط مع التأكد من أن المهام المسندة لشخص محدد لا تظهر للآخرين
+        if role_conditions:
+            role_condition = f"({' OR '.join(role_conditions)}) AND assigned_to IS NULL"
+            user_role_condition = f"({user_condition} OR {role_condition})"
+        else:
+            user_role_condition = user_condition
+
+        return user_role_condition
+
+    def get_virtual_tasks(self, from_date, to_date, search_term=None, limit=None) -> List[Dict]:
+        """المهام المستقبلية غير المحفوظة (virtual) ضمن نطاق التاريخ
+
+        `limit` caps the occurrences per project; it is ignored when searching,
+        since the search filter runs after the expansion.
         """
+        tasks = get_virtual_tasks(
+            from_date, to_date, roles=None if self.is_admin else self.user_roles,
+            limit=None if search_term else limit
+        )
+
+        if search_term:
+            tasks = [task for task in tasks if matches_search(search_term, task.task_title, task.notes)]
+
+        return tasks
+
+    def resolve_task_name(self, task_name: str) -> Optional[str]:
+        """تحويل المهمة الافتراضية إلى مهمة حقيقية قبل التعديل عليها
+
+        Returns the real task name, or None if the user may not edit the occurrence.
+        """
+        if not is_virtual_task(task_name):
+            return task_name
+
+        virtual_task = get_virtual_task(task_name)
+        if not virtual_task:
+            raise frappe.DoesNotExistError
+
+        if not self._can_edit_task(virtual_task):
+            return None
+
+        return materialize_virtual_task(task_name)
+
+def get_virtual_window(due_filter=None):
+    """نطاق التواريخ الذي تُعرض فيه المهام الافتراضية حسب فلتر التاريخ"""
+    today = getdate(nowdate())
+
+    if due_filter == "overdue":
+        return None
+    if due_filter == "today":
+        return today, today
+    if due_filter == "week":
+        return today, getdate(add_days(today, 7))
+    if due_filter == "month":
+        return today, getdate(add_months(today, 1))
+
+    return today, getdate(add_days(today, DEFAULT_VIRTUAL_WINDOW_DAYS))
+
+def encode_task_cursor(task) -> str:
+    """مؤشر الصفحة التالية: (due_date, name) لآخر مهمة في الصفحة"""
+    key = [str(frappe.utils.get_datetime(task.get("due_date"))), task.get("name")]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_task_cursor(cursor: str):
+    try:
+        due_date, name = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return frappe.utils.get_datetime(due_date), name
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+
+def _task_sort_key(task):
+    return frappe.utils.get_datetime(task.get("due_date")), task.get("name") or ""
+
+def get_task_list_version(filter_conditions, *parts) -> str:
+    """رمز إصدار القائمة: عدد المهام وآخر تعديل ضمن نطاق المستخدم
+
+    Also covers the projects (virtual tasks come from their schedules), the
+    current date (due filters and the virtual window move with it) and the
+    request parameters in `parts`.
+    """
+    where_clause = " AND ".join(filter_conditions) if filter_conditions else "1=1"
+    tasks_version = frappe.db.sql(f"""
+        SELECT COUNT(*), MAX(modified)
+        FROM `tabService Task`
+        WHERE {where_clause}
+    """)[0]
+    projects_modified = frappe.db.sql("SELECT MAX(modified) FROM `tabService Project`")[0][0]
+
+    raw = "|".join(str(part) for part in (
+        *tasks_version, projects_modified, nowdate(), where_clause, *parts
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+def build_task_page_query(task_api, status=None, due_filter=None, search_term=None, after=None,
+                          page_length=DEFAULT_PAGE_LENGTH) -> str:
+    """SQL صفحة واحدة من get_my_tasks (يستخدمه utils.index_check أيضاً)"""
+    where_conditions = task_api.get_filter_conditions(status, due_filter)
+
+    # فلتر البحث (فهرس FULLTEXT على العنوان ونص الملاحظات)
+    if search_term:
+        where_conditions.append(get_search_condition(search_term))
+
+    # شرط المؤشر (keyset): المهام بعد آخر مهمة في الصفحة السابقة
+    if after:
+        after_due, after_name = frappe.db.escape(after[0]), frappe.db.escape(after[1])
+        where_conditions.append(
+            f"(due_date > {after_due} OR (due_date = {after_due} AND name > {after_name}))"
+        )
+
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    return f"""
+        SELECT 
+            name, task_title, due_date, local_due_date,
+            assigned_to, assigned_role, status,
+            notes, creation, modified, parent
+        FROM `tabService Task`
+        WHERE {where_clause}
+        ORDER BY due_date ASC, name ASC
+        LIMIT {page_length + 1}
+    """
+
+@frappe.whitelist()
+def get_my_tasks(status=None, due_filter=None, search_term=None, page_length=DEFAULT_PAGE_LENGTH,
+                 cursor=None, version=None):
+    """الحصول على المهام الخاصة بالمستخدم مع الترجمات
+
+    Results are paginated by (due_date, name): pass the returned `next_cursor` as
+    `cursor` to get the next page. Stats are only computed for the first page.
+
+    The first page carries a `version` token. Passing it back as `version` returns
+    only {"success": True, "not_modified": True, "version": ...} while nothing in
+    the caller's scope has changed.
+    """
+    try:
+        task_api = TaskAPI()
+        page_length = min(max(cint(page_length) or DEFAULT_PAGE_LENGTH, 1), MAX_PAGE_LENGTH)
+        after = decode_task_cursor(cursor) if cursor else None
         
+        # بناء شرط WHERE clause
+        where_conditions = task_api.get_filter_conditions(status, due_filter)
+        
+        # رد مختصر إذا لم يتغير شيء منذ آخر طلب (للتحديث الدوري)
+        list_version = None
+        if not after:
+            list_version = get_task_list_version(where_conditions, search_term, page_length)
+            if version and version == list_version:
+                return {'success': True, 'not_modified': True, 'version': list_version}
+
         # تنفيذ الاستعلام
+        sql_query = build_task_page_query(task_api, status, due_filter, search_term, after, page_length)
         tasks = frappe.db.sql(sql_query, as_dict=True)
         
+        # إضافة المهام المستقبلية الافتراضية (غير المحفوظة بعد)
+        virtual_window = get_virtual_window(due_filter)
+        if virtual_window and (not status or status in ('All', 'Pending')):
+            from_date, to_date = virtual_window
+            # التوسيع يبدأ من المؤشر وينتهي عند آخر مهمة حقيقية في الصفحة
+            # (هامش يوم لأن المؤشر بتوقيت UTC والتواريخ الافتراضية محلية)
+            if after:
+                from_date = max(from_date, getdate(add_days(after[0], -1)))
+            if len(tasks) > page_length:
+                to_date = min(to_date, getdate(add_days(tasks[-1].due_date, 1)))
+            virtual_tasks = task_api.get_virtual_tasks(
+                from_date, to_date, search_term=search_term, limit=page_length + 1
+            )
+            if after:
+                virtual_tasks = [t for t in virtual_tasks if _task_sort_key(t) > after]
+            if virtual_tasks:
+                tasks.extend(virtual_tasks)
+                tasks.sort(key=_task_sort_key)
+        
+        # صفحة واحدة فقط، ومؤشر للصفحة التالية إن وجدت
+        has_more = len(tasks) > page_length
+        tasks = tasks[:page_length]
+        next_cursor = encode_task_cursor(tasks[-1]) if has_more else None
+        
         # تنسيق المهام مع الترجمات
         formatted_tasks = []
         for task in tasks:
@@ -202,41 +380,34 @@ def get_my_tasks(status=None, due_filter=None, search_term=None):
                 frappe.log_error(f"Error formatting task {task.get('name')}: {str(e)}")
                 continue
         
-        # حساب الإحصائيات
-        stats_where_clause = where_clause
-        # إزالة فلتر البحث من الإحصائيات
-        if search_term:
-            stats_conditions = [cond for cond in where_conditions if "task_title LIKE" not in cond and "notes LIKE" not in cond]
-            stats_where_clause = " AND ".join(stats_conditions) if stats_conditions else "1=1"
-        
-        stats_query = f"""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed,
-                SUM(CASE WHEN status = 'In Progress' THEN 1 ELSE 0 END) as in_progress,
-                SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END) as pending,
-                SUM(CASE WHEN due_date < '{nowdate()}' AND status != 'Completed' THEN 1 ELSE 0 END) as overdue
-            FROM `tabService Task`
-            WHERE {stats_where_clause}
-        """
-        
-        stats_result = frappe.db.sql(stats_query, as_dict=True)
-        stats = stats_result[0] if stats_result else {
-            'total': 0, 'completed': 0, 'in_progress': 0, 'pending': 0, 'overdue': 0
-        }
+        # الإحصائيات للصفحة الأولى فقط
+        if after:
+            return {
+                'success': True,
+                'tasks': formatted_tasks,
+                'count': len(formatted_tasks),
+                'has_more': has_more,
+                'next_cursor': next_cursor
+            }
         
-        # تحويل القيم إلى int للتأكد من التوافق
-        for key in stats:
-            if stats[key] is None:
-                stats[key] = 0
-            else:
-                stats[key] = int(stats[key])
+        # حساب الإحصائيات (بدون فلتر البحث، من الذاكرة المؤقتة)
+        stats = task_api.get_task_stats(status, due_filter).get('stats') or dict(EMPTY_STATS)
         
         return {
             'success': True,
             'tasks': formatted_tasks,
             'count': len(formatted_tasks),
-            'stats': stats
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+            'version': list_version,
+            'stats': stats,
+            # ما يحتاجه العميل للاشتراك في تحديثات المؤسسة وتصفيتها
+            'realtime': {
+                'organization': get_user_info(task_api.current_user).organization,
+                'user': task_api.current_user,
+                'roles': task_api.user_roles,
+                'is_admin': task_api.is_admin
+            }
         }
         
     except Exception as e:
@@ -260,6 +431,14 @@ def mark_task_completed(task_name):
     try:
         task_api = TaskAPI()
         
+        # المهام الافتراضية تُحفظ كمهمة حقيقية عند أول تعديل
+        task_name = task_api.resolve_task_name(task_name)
+        if not task_name:
+            return {
+                "success": False,
+                "message": _("You don't have permission to modify this task")
+            }
+        
         # جلب المهمة
         task = frappe.get_doc("Service Task", task_name)
         
@@ -272,6 +451,7 @@ def mark_task_completed(task_name):
         
         # تحديث الحالة باستخدام frappe.db.set_value لتجاوز قيود سير العمل
         frappe.db.set_value("Service Task", task_name, "status", "Completed", update_modified=True)
+        invalidate_task_stats([task])
         frappe.db.commit()
         
         return {
@@ -297,8 +477,13 @@ def get_task_details(task_name):
     try:
         task_api = TaskAPI()
         
-        # جلب المهمة
-        task = frappe.get_doc("Service Task", task_name)
+        # جلب المهمة (الافتراضية تُحسب من جدول المشروع)
+        if is_virtual_task(task_name):
+            task = get_virtual_task(task_name)
+            if not task:
+                raise frappe.DoesNotExistError
+        else:
+            task = frappe.get_doc("Service Task", task_name)
         
         # التحقق من الصلاحيات
         can_view = task_api.is_admin or (
@@ -339,9 +524,8 @@ def get_user_timezone_info(user=None):
         if not user:
             user = frappe.session.user
         
-        # الحصول على إعدادات المستخدم
-        user_settings = frappe.get_doc("User", user)
-        user_timezone = user_settings.time_zone or frappe.get_system_settings("time_zone") or "UTC"
+        # الحصول على المنطقة الزمنية للمستخدم (من الذاكرة المؤقتة المشتركة)
+        user_timezone = tz_manager.get_user_timezone_name(user)
         
         # حساب فرق التوقيت
         tz = pytz.timezone(user_timezone)
@@ -421,6 +605,14 @@ def update_task_status(task_name, new_status):
                 "message": _("Invalid status. Allowed statuses: {0}").format(', '.join(valid_statuses))
             }
         
+        # المهام الافتراضية تُحفظ كمهمة حقيقية عند أول تعديل
+        task_name = task_api.resolve_task_name(task_name)
+        if not task_name:
+            return {
+                "success": False,
+                "message": _("You don't have permission to modify this task")
+            }
+        
         # جلب المهمة
         task = frappe.get_doc("Service Task", task_name)
         
@@ -433,6 +625,7 @@ def update_task_status(task_name, new_status):
         
         # تحديث الحالة باستخدام frappe.db.set_value لتجاوز قيود سير العمل
         frappe.db.set_value("Service Task", task_name, "status", new_status, update_modified=True)
+        invalidate_task_stats([task])
         frappe.db.commit()
         
         return {
@@ -488,11 +681,15 @@ def get_task_filters():
         }
 
 @frappe.whitelist()
-def search_tasks(search_term, status=None, due_filter=None):
+def search_tasks(search_term, status=None, due_filter=None, page_length=DEFAULT_PAGE_LENGTH, cursor=None,
+                 version=None):
     """البحث في المهام"""
     try:
         # استخدام get_my_tasks مع معاملات البحث
-        return get_my_tasks(status=status, due_filter=due_filter, search_term=search_term)
+        return get_my_tasks(
+            status=status, due_filter=due_filter, search_term=search_term,
+            page_length=page_length, cursor=cursor, version=version
+        )
         
     except Exception as e:
         frappe.log_error(f"Error in search_tasks: {str(e)}")
@@ -510,6 +707,66 @@ def search_tasks(search_term, status=None, due_filter=None):
             }
         }
 
+def build_suggest_query(task_api, search_term, limit=DEFAULT_SUGGESTION_LIMIT) -> Optional[str]:
+    """SQL اقتراحات البحث، أو None إذا لم يكن في المصطلح كلمات"""
+    match_expression = get_match_expression(search_term)
+    if not match_expression:
+        return None
+
+    where_conditions = [match_expression]
+    scope_condition = task_api.get_scope_condition()
+    if scope_condition:
+        where_conditions.append(scope_condition)
+
+    return f"""
+        SELECT name, task_title, due_date, local_due_date, status, parent,
+            {match_expression} AS score
+        FROM `tabService Task`
+        WHERE {" AND ".join(where_conditions)}
+        ORDER BY score DESC, due_date ASC
+        LIMIT {limit}
+    """
+
+@frappe.whitelist()
+def suggest_tasks(search_term, limit=DEFAULT_SUGGESTION_LIMIT):
+    """اقتراحات البحث أثناء الكتابة: المهام مرتبة حسب درجة التطابق"""
+    try:
+        task_api = TaskAPI()
+        limit = min(max(cint(limit) or DEFAULT_SUGGESTION_LIMIT, 1), MAX_SUGGESTION_LIMIT)
+
+        sql_query = build_suggest_query(task_api, search_term, limit)
+        if not sql_query:
+            return {"success": True, "tasks": [], "count": 0}
+
+        tasks = frappe.db.sql(sql_query, as_dict=True)
+
+        return {
+            "success": True,
+            "tasks": [
+                {
+                    "name": task.name,
+                    "task_title": task.task_title,
+                    "due_date": task.due_date,
+                    "local_due_date": task.local_due_date,
+                    "status": task.status,
+                    "status_translated": _(task.status or "Pending"),
+                    "parent": task.parent,
+                    "score": task.score
+                }
+                for task in tasks
+            ],
+            "count": len(tasks)
+        }
+
+    except Exception as e:
+        frappe.log_error(f"Error in suggest_tasks: {str(e)}")
+        return {
+            "success": False,
+            "message": _("Error in search: {0}").format(str(e)),
+            "tasks": [],
+            "count": 0
+        }
+
 @frappe.whitelist()
 def batch_update_tasks(task_names, updates):
     """تحديث مجموعة من المهام"""
@@ -533,7 +790,15 @@ def batch_update_tasks(task_names, updates):
         
         for task_name in task_names:
             try:
-                task = frappe.get_doc("Service Task", task_name)
+                real_name = task_api.resolve_task_name(task_name)
+                if not real_name:
+                    failed_tasks.append({
+                        "task": task_name,
+                        "error": _("No permission")
+                    })
+                    continue
+                
+                task = frappe.get_doc("Service Task", real_name)
                 
                 # التحقق من الصلاحيات
                 if not task_api._can_edit_task(task):
@@ -579,17 +844,25 @@ def export_tasks(filters=None):
         if filters and isinstance(filters, str):
             filters = json.loads(filters)
         
-        # جلب المهام
-        tasks_result = get_my_tasks(
-            status=filters.get('status') if filters else None,
-            due_filter=filters.get('due_filter') if filters else None,
-            search_term=filters.get('search_term') if filters else None
-        )
-        
-        if not tasks_result.get('success'):
-            return tasks_result
-        
-        tasks = tasks_result.get('tasks', [])
+        # جلب المهام صفحة بعد صفحة
+        tasks = []
+        cursor = None
+        while True:
+            tasks_result = get_my_tasks(
+                status=filters.get('status') if filters else None,
+                due_filter=filters.get('due_filter') if filters else None,
+                search_term=filters.get('search_term') if filters else None,
+                page_length=MAX_PAGE_LENGTH,
+                cursor=cursor
+            )
+            
+            if not tasks_result.get('success'):
+                return tasks_result
+            
+            tasks.extend(tasks_result.get('tasks', []))
+            cursor = tasks_result.get('next_cursor')
+            if not cursor:
+                break
         
         # إعداد البيانات للتصدير
         export_data = []
@@ -682,22 +955,18 @@ def get_dashboard_data():
     try:
         task_api = TaskAPI()
         
-        # الإحصائيات الأساسية
-        stats_result = get_my_tasks()
+        # الإحصائيات الأساسية (من الذاكرة المؤقتة)
+        stats_result = task_api.get_task_stats()
         if not stats_result.get('success'):
-            return stats_result
+            return {
+                "success": False,
+                "message": _("Error loading dashboard: {0}").format(stats_result.get('error'))
+            }
         
-        stats = stats_result.get('stats', {})
+        stats = stats_result['stats']
         
         # المهام القادمة
-        upcoming_tasks = frappe.db.sql("""
-            SELECT name, task_title, due_date, status
-            FROM `tabService Task`
-            WHERE due_date >= %s
-            AND status != 'Completed'
-            ORDER BY due_date ASC
-            LIMIT 5
-        """, (nowdate(),), as_dict=True)
+        upcoming_tasks = frappe.db.sql(UPCOMING_TASKS_QUERY, (nowdate(),), as_dict=True)
         
         # تنسيق المهام القادمة
         formatted_upcoming = []
@@ -792,6 +1061,14 @@ def update_task(task_name, updates):
         if isinstance(updates, str):
             updates = json.loads(updates)
         
+        # المهام الافتراضية تُحفظ كمهمة حقيقية عند أول تعديل
+        task_name = task_api.resolve_task_name(task_name)
+        if not task_name:
+            return {
+                "success": False,
+                "message": _("You don't have permission to modify this task")
+            }
+        
         # جلب المهمة
         task = frappe.get_doc("Service Task", task_name)
         
@@ -977,18 +1254,7 @@ def get_user_performance():
         task_api = TaskAPI()
         
         # إحصائيات المستخدم الحالي
-        user_stats_query = """
-            SELECT 
-                COUNT(*) as total_assigned,
-                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed,
-                SUM(CASE WHEN status = 'Completed' AND due_date >= modified THEN 1 ELSE 0 END) as on_time,
-                SUM(CASE WHEN status = 'Completed' AND due_date < modified THEN 1 ELSE 0 END) as late,
-                SUM(CASE WHEN status != 'Completed' AND due_date < %s THEN 1 ELSE 0 END) as overdue
-            FROM `tabService Task`
-            WHERE assigned_to = %s
-        """
-        
-        stats = frappe.db.sql(user_stats_query, 
+        stats = frappe.db.sql(USER_STATS_QUERY, 
                              (nowdate(), task_api.current_user), 
                              as_dict=True)[0]
         
@@ -1024,6 +1290,20 @@ def get_user_performance():
 
 # دوال مساعدة إضافية
 
+def build_reminders_query(task_api) -> str:
+    """SQL تذكيرات المستخدم بين تاريخين (معاملان %s)"""
+    reminders_query = """
+        SELECT name, task_title, due_date, assigned_to, assigned_role
+        FROM `tabService Task`
+        WHERE due_date BETWEEN %s AND %s
+        AND status NOT IN ('Completed', 'Cancelled')
+    """
+
+    scope_condition = task_api.get_scope_condition()
+    if scope_condition:
+        reminders_query += f" AND {scope_condition}"
+    return reminders_query
+
 @frappe.whitelist()
 def get_task_reminders():
     """الحصول على تذكيرات المهام"""
@@ -1033,25 +1313,10 @@ def get_task_reminders():
         # المهام التي تحتاج تذكير (مستحقة خلال 24 ساعة)
         tomorrow = add_days(nowdate(), 1)
         
-        reminders_query = """
-            SELECT name, task_title, due_date, assigned_to, assigned_role
-            FROM `tabService Task`
-            WHERE due_date BETWEEN %s AND %s
-            AND status NOT IN ('Completed', 'Cancelled')
-        """
-        
-        if not task_api.is_admin:
-            reminders_query += f" AND (assigned_to = {frappe.db.escape(task_api.current_user)}"
-            if task_api.user_roles:
-                role_conditions = " OR ".join([f"assigned_role = {frappe.db.escape(role)}" 
-                                             for role in task_api.user_roles])
-                reminders_query += f" OR ({role_conditions} AND assigned_to IS NULL))"
-            else:
-                reminders_query += ")"
-        
-        reminders = frappe.db.sql(reminders_query, 
+        reminders = frappe.db.sql(build_reminders_query(task_api), 
                                  (nowdate(), tomorrow), 
                                  as_dict=True)
+        reminders.extend(task_api.get_virtual_tasks(nowdate(), tomorrow))
         
         # تنسيق التذكيرات
         formatted_reminders = []
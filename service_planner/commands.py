@@ -0,0 +1,93 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+# bench imports this module with no site connected: app modules are imported
+# inside the functions, once a site is initialized
+
+
+def _init_worker(site, sites_path):
+    """Each pool process keeps its own site context and DB connection."""
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+
+
+def _regenerate_project(project_name):
+    from service_planner.server_script.auto_generate_tasks import regenerate_in_background
+
+    start = time.monotonic()
+    try:
+        status = regenerate_in_background(project_name)
+    except Exception as e:
+        frappe.db.rollback()
+        status = f"Failed ({e})"
+    return project_name, status, time.monotonic() - start
+
+
+def get_projects_to_regenerate(filters=None, include_closed=False):
+    from service_planner.server_script.auto_generate_tasks import CLOSED_PROJECT_STATUSES
+
+    filters = json.loads(filters) if isinstance(filters, str) else dict(filters or {})
+    filters.setdefault("docstatus", ["<", 2])
+    if not include_closed:
+        filters.setdefault("status", ["not in", CLOSED_PROJECT_STATUSES])
+    return frappe.get_all("Service Project", filters=filters, pluck="name", order_by="name asc")
+
+
+@click.command("regenerate-service-tasks")
+@click.option("--filters", help='JSON filters for Service Project, e.g. \'{"organization": "ACME"}\'')
+@click.option("--workers", type=int, help="Number of worker processes (defaults to the CPU count)")
+@click.option("--include-closed", is_flag=True, default=False, help="Also regenerate On Hold/Completed/Cancelled projects")
+@pass_context
+def regenerate_service_tasks(context, filters=None, workers=None, include_closed=False):
+    """Regenerate the tasks of many Service Projects in parallel."""
+    site = get_site(context)
+    # bench runs app commands from the sites directory
+    sites_path = os.getcwd()
+
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    try:
+        project_names = get_projects_to_regenerate(filters, include_closed)
+    finally:
+        frappe.destroy()
+
+    total = len(project_names)
+    if not total:
+        click.echo("No Service Projects match the filters")
+        return
+
+    workers = max(1, min(workers or os.cpu_count() or 1, total))
+    click.echo(f"Regenerating {total} Service Projects with {workers} workers")
+
+    started = time.monotonic()
+    failed = []
+    # spawn: workers must not inherit the parent's DB/Redis sockets
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(site, sites_path),
+    ) as executor:
+        futures = [executor.submit(_regenerate_project, name) for name in project_names]
+        for done, future in enumerate(as_completed(futures), start=1):
+            project_name, status, elapsed = future.result()
+            if status != "Complete":
+                failed.append(project_name)
+            click.echo(f"[{done}/{total}] {project_name}: {status} in {elapsed:.2f}s")
+
+    click.echo(
+        f"Done in {time.monotonic() - started:.1f}s: {total - len(failed)} regenerated, {len(failed)} failed"
+    )
+    if failed:
+        click.secho("Failed projects (see Error Log): " + ", ".join(failed), fg="red")
+        raise SystemExit(1)
+
+
+commands = [regenerate_service_tasks]
@@ -40,20 +40,66 @@ doctype_list_js = {
 # Server-Side Event Hooks
 doc_events = {
     "Service Task": {
-        "after_insert": "service_planner.server_script.notify_task_by_role.notify_users_by_assigned_role",
-        "on_update": "service_planner.server_script.notify_task_by_role.notify_users_by_assigned_role"
+        "after_insert": [
+            "service_planner.server_script.notification_outbox.record_task_event",
+            "service_planner.utils.task_stats.on_task_change"
+        ],
+        "on_update": [
+            "service_planner.server_script.notification_outbox.record_task_event",
+            "service_planner.utils.task_stats.on_task_change"
+        ],
+        "on_trash": "service_planner.utils.task_stats.on_task_change"
     },
     "Service Project": {
         "before_save": "service_planner.server_script.auto_generate_tasks.execute",
-        "validate": "service_planner.server_script.auto_generate_tasks.validate_schedule_configuration"
+        "validate": "service_planner.server_script.auto_generate_tasks.validate_schedule_configuration",
+        "on_update": [
+            "service_planner.server_script.auto_generate_tasks.flush_pending_tasks",
+            "service_planner.utils.task_stats.on_project_change"
+        ],
+        "on_update_after_submit": [
+            "service_planner.server_script.auto_generate_tasks.flush_pending_tasks",
+            "service_planner.utils.task_stats.on_project_change"
+        ],
+        "on_cancel": "service_planner.utils.task_stats.on_project_change",
+        "on_trash": "service_planner.utils.task_stats.on_project_change"
+    },
+    "User": {
+        "on_update": [
+            "service_planner.utils.timezone_utils.on_user_update",
+            "service_planner.utils.role_index.on_user_change",
+            "service_planner.utils.task_stats.on_user_change"
+        ],
+        "on_trash": [
+            "service_planner.utils.timezone_utils.on_user_update",
+            "service_planner.utils.role_index.on_user_change",
+            "service_planner.utils.task_stats.on_user_change"
+        ]
+    },
+    "Has Role": {
+        "on_update": [
+            "service_planner.utils.role_index.on_user_change",
+            "service_planner.utils.task_stats.on_user_change"
+        ],
+        "on_trash": [
+            "service_planner.utils.role_index.on_user_change",
+            "service_planner.utils.task_stats.on_user_change"
+        ]
     }
 }
 
 
-# Scheduler Tasks (Daily Reminder)
+# Scheduler Tasks (Hourly Reminder)
 scheduler_events = {
-    "daily": [
+    # Safety net for outbox events whose dispatch job was not enqueued
+    "all": [
+        "service_planner.server_script.notification_outbox.dispatch_notification_outbox"
+    ],
+    "hourly": [
         "service_planner.server_script.task_notifications.notify_scheduled_tasks"
+    ],
+    "daily": [
+        "service_planner.server_script.auto_generate_tasks.extend_task_horizons"
     ]
 }
 
@@ -0,0 +1,5 @@
+from service_planner.service_planner.doctype.service_task.service_task import add_service_task_indexes
+
+
+def execute():
+    add_service_task_indexes()
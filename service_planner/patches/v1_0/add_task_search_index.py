@@ -0,0 +1,30 @@
+import frappe
+
+from service_planner.utils.task_search import add_task_search_index, get_notes_text
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def execute():
+    """تعبئة notes_text للمهام الحالية ثم إنشاء فهرس FULLTEXT"""
+    last_name = ""
+    while True:
+        rows = frappe.db.sql("""
+            SELECT name, notes
+            FROM `tabService Task`
+            WHERE name > %(last_name)s AND IFNULL(notes, '') != ''
+            ORDER BY name ASC
+            LIMIT %(limit)s
+        """, {"last_name": last_name, "limit": BACKFILL_CHUNK_SIZE}, as_dict=True)
+        if not rows:
+            break
+
+        for row in rows:
+            frappe.db.sql(
+                "UPDATE `tabService Task` SET notes_text = %s WHERE name = %s",
+                (get_notes_text(row.notes), row.name)
+            )
+        frappe.db.commit()
+        last_name = rows[-1].name
+
+    add_task_search_index()
@@ -1,5 +1,19 @@
 // service_planner/public/js/my_tasks.js
 
+// المهام المعروضة حالياً وإحصائياتها (لتطبيق التحديثات الفورية بدون إعادة تحميل)
+let currentTasks = [];
+let currentStats = null;
+let realtimeContext = null;
+let subscribedToDeltas = false;
+
+// ترقيم الصفحات بالمؤشر (due_date, name)
+const PAGE_LENGTH = 50;
+let nextCursor = null;
+let loadingMore = false;
+
+// رمز إصدار الصفحة الأولى: التحديث الدوري لا يعيد القائمة إذا لم تتغير
+let listVersion = null;
+
 frappe.ready(function() {
    
 
@@ -20,8 +34,11 @@ frappe.ready(function() {
     // ربط أحداث الفلاتر
     bindFilterEvents();
     
+    // تحميل المزيد عند التمرير
+    bindInfiniteScroll();
+    
     // تحديث تلقائي كل 5 دقائق
-    setInterval(loadTasks, 300000);
+    setInterval(() => loadTasks(), 300000);
 });
 
 function initializePage() {
@@ -61,50 +78,180 @@ function bindFilterEvents() {
     });
 }
 
-function loadTasks() {
+function loadTasks(append = false) {
     const statusFilter = $("#status-filter").val();
     const dueFilter = $("#due-filter").val();
     const searchTerm = $("#search-input").val().trim();
 
+    if (append && (!nextCursor || loadingMore)) return;
+
     console.log(__("Loading tasks with filters:"), { 
         status: statusFilter, 
         due_filter: dueFilter,
         search: searchTerm 
     });
 
+    loadingMore = append;
     frappe.call({
         method: "service_planner.api.task_api.get_my_tasks",
         args: {
             status: statusFilter === "All" ? null : statusFilter,
             due_filter: dueFilter === "all" ? null : dueFilter,
-            search_term: searchTerm || null
+            search_term: searchTerm || null,
+            page_length: PAGE_LENGTH,
+            cursor: append ? nextCursor : null,
+            version: append ? null : listVersion
         },
         callback: function(r) {
             showLoadingIndicator(false);
+            loadingMore = false;
+            
+            if (r.message && r.message.not_modified) {
+                return;
+            }
             
             if (r.message && r.message.success) {
-                const { tasks, stats, count } = r.message;
+                const { tasks, stats, realtime } = r.message;
+                
+                currentTasks = append ? currentTasks.concat(tasks || []) : (tasks || []);
+                nextCursor = r.message.has_more ? r.message.next_cursor : null;
+                if (!append) {
+                    listVersion = r.message.version || null;
+                    currentStats = stats || null;
+                    subscribeToTaskUpdates(realtime);
+                }
                 
-                if (!tasks || tasks.length === 0) {
+                if (currentTasks.length === 0) {
                     showNoTasks();
                     updateTaskCounter(0);
                     updateStats(stats || {total: 0, completed: 0, in_progress: 0, pending: 0, overdue: 0});
                     return;
                 }
 
-                renderTasks(tasks);
-                updateTaskCounter(count);
-                updateStats(stats);
-            } else {
+                renderTasks(currentTasks);
+                updateTaskCounter(currentTasks.length);
+                if (!append) updateStats(stats);
+            } else if (!append) {
+                listVersion = null;
                 showError(r.message?.message || __("Error loading tasks"));
             }
         },
         error: function(err) {
             console.error(__("API Error:"), err);
             showLoadingIndicator(false);
-            showError(__("Server connection failed"));
+            loadingMore = false;
+            if (!append) {
+                listVersion = null;
+                showError(__("Server connection failed"));
+            }
+        }
+    });
+}
+
+function bindInfiniteScroll() {
+    // تحميل الصفحة التالية عند الاقتراب من نهاية الجدول
+    $(window).on("scroll", function() {
+        if (!nextCursor || loadingMore) return;
+        if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 300) {
+            showLoadingIndicator(true, __("Loading more tasks..."));
+            loadTasks(true);
+        }
+    });
+}
+
+function subscribeToTaskUpdates(context) {
+    if (!context || !frappe.realtime || !frappe.realtime.on) return;
+    realtimeContext = context;
+    
+    // غرف (المؤسسة، الدور) يحددها الخادم، والمهام المعينة تصل على قناة المستخدم؛ التسجيل مرة واحدة
+    if (subscribedToDeltas) return;
+    frappe.realtime.on("service_task_delta", applyTaskDelta);
+    joinTaskDeltaRooms();
+    if (frappe.realtime.socket) {
+        // الغرف لا تبقى بعد إعادة الاتصال
+        frappe.realtime.socket.on("connect", joinTaskDeltaRooms);
+    }
+    subscribedToDeltas = true;
+}
+
+function joinTaskDeltaRooms() {
+    frappe.realtime.emit("service_planner:task_delta_subscribe");
+}
+
+function isRelevantTask(task) {
+    const ctx = realtimeContext;
+    if (!ctx) return false;
+    if (ctx.is_admin) return true;
+    if (task.assigned_to) return task.assigned_to === ctx.user;
+    return (ctx.roles || []).includes(task.assigned_role);
+}
+
+function applyTaskDelta(data) {
+    const deltas = ((data && data.tasks) || []).filter(isRelevantTask);
+    if (!deltas.length) return;
+    
+    if (data.action === "reminder") {
+        frappe.show_alert({
+            message: deltas.map(t => frappe.utils.escape_html(t.task_title || t.name)).join("<br>"),
+            indicator: "orange"
+        });
+        return;
+    }
+    
+    const statusFilter = $("#status-filter").val();
+    const filtered = (statusFilter && statusFilter !== "All") || $("#due-filter").val() !== "all"
+        || $("#search-input").val().trim();
+    
+    deltas.forEach(delta => {
+        const index = currentTasks.findIndex(t => t.name === delta.name);
+        const previous = index >= 0 ? currentTasks[index] : null;
+        const task = Object.assign({}, previous || {}, delta);
+        task.status = task.status || "Pending";
+        task.status_translated = __(task.status);
+        task.task_title_translated = __(task.task_title || "");
+        task.can_edit = !task.is_virtual && isRelevantTask(task);
+        
+        // المهام بعد آخر صفحة محملة ستأتي مع الصفحات التالية
+        const pastLoadedPage = nextCursor && currentTasks.length
+            && new Date(task.due_date) > new Date(currentTasks[currentTasks.length - 1].due_date);
+        
+        if (previous) {
+            currentTasks[index] = task;
+        } else if (!filtered && !pastLoadedPage) {
+            currentTasks.push(task);
+        } else {
+            // مهمة جديدة خارج الفلتر الحالي: تظهر عند التحميل التالي
+            return;
         }
+        adjustStats(previous, task);
     });
+    
+    if (statusFilter && statusFilter !== "All") {
+        currentTasks = currentTasks.filter(t => t.status === statusFilter);
+    }
+    currentTasks.sort((a, b) => new Date(a.due_date) - new Date(b.due_date));
+    
+    if (currentTasks.length) {
+        renderTasks(currentTasks);
+    } else {
+        showNoTasks();
+    }
+    updateTaskCounter(currentTasks.length);
+    updateStats(currentStats);
+}
+
+function adjustStats(previous, task) {
+    if (!currentStats) return;
+    const keys = {"Completed": "completed", "In Progress": "in_progress", "Pending": "pending"};
+    
+    if (previous) {
+        const oldKey = keys[previous.status];
+        if (oldKey) currentStats[oldKey] = Math.max(0, (currentStats[oldKey] || 0) - 1);
+    } else {
+        currentStats.total = (currentStats.total || 0) + 1;
+    }
+    const newKey = keys[task.status];
+    if (newKey) currentStats[newKey] = (currentStats[newKey] || 0) + 1;
 }
 
 function showLoadingIndicator(show, message = '') {
@@ -1,24 +1,62 @@
 import frappe
+import base64
 import calendar
 import pytz
+import string
 from datetime import datetime, time, timedelta
-from frappe.utils import add_days, getdate, get_time, nowdate, format_datetime, get_datetime_str
+from frappe.utils import add_days, cint, flt, getdate, get_datetime, get_time, nowdate, format_datetime, get_datetime_str
 from functools import lru_cache
 from frappe import _
+from service_planner.server_script.notification_outbox import EVENT_TASK_CREATED, record_task_events
+from service_planner.utils.recurrence import RecurrenceRule, weekday_mask
+from service_planner.utils.task_search import get_notes_text
+from service_planner.utils.task_stats import invalidate_task_stats
+from service_planner.utils.timezone_utils import tz_manager as shared_tz_manager
+
+# Safety limit for schedules without any end date
+MAX_TASK_DATES = 365 * 2
+
+# Weeks of tasks materialized ahead of today; override per site with
+# "service_planner_horizon_weeks" in site_config.json (0 disables the horizon)
+DEFAULT_HORIZON_WEEKS = 8
+
+# Projects in these states are not extended by the nightly horizon job
+CLOSED_PROJECT_STATUSES = ['On Hold', 'Completed', 'Cancelled']
+
+# Regenerations producing more occurrences than this run on the long queue;
+# override per site with "service_planner_background_regeneration_threshold"
+DEFAULT_BACKGROUND_REGENERATION_THRESHOLD = 200
+
+REGENERATION_COMPLETE_EVENT = "service_project_tasks_regenerated"
+
+# Rows per multi-row INSERT when writing generated tasks
+TASK_INSERT_CHUNK_SIZE = 500
+
+# Changes to any of these fields invalidate the generated tasks
+SCHEDULE_CRITICAL_FIELDS = (
+    'schedule_type', 'start_date', 'end_date', 'weekly_days',
+    'interval_days', 'task_time', 'default_role', 'duration_hours',
+    'horizon_weeks'
+)
+
+# Page size of preview_next_tasks
+DEFAULT_PREVIEW_PAGE_LENGTH = 20
+MAX_PREVIEW_PAGE_LENGTH = 500
 
 class TimezoneManager:
-    """Class to handle all timezone-related operations"""
+    """Class to handle all timezone-related operations
+
+    Holds no site state: the system timezone is resolved for the current site on
+    every access, so importing this module does not touch the database.
+    """
     
-    def __init__(self):
-        self.system_timezone = frappe.db.get_single_value("System Settings", "time_zone") or "UTC"
+    @property
+    def system_timezone(self):
+        return shared_tz_manager.get_system_timezone()
     
-    @lru_cache(maxsize=128)
     def get_user_timezone(self, user):
-        """Get user timezone with caching"""
-        try:
-            return frappe.db.get_value("User", user, "time_zone") or self.system_timezone
-        except Exception:
-            return self.system_timezone
+        """Get user timezone name (cached by the shared timezone service)"""
+        return shared_tz_manager.get_user_timezone_name(user)
     
     def is_dst_active(self, timezone_str, dt=None):
         """Check if daylight saving is active for timezone"""
@@ -61,8 +99,15 @@ def execute(doc, method):
     validate_schedule_configuration(doc, method)
     
     # Check if we need to regenerate tasks or just update task titles
-    if should_regenerate_tasks(doc):
-        generate_service_tasks(doc)
+    if is_end_date_only_change(doc) and apply_end_date_change(doc) is not None:
+        # Only the tail of the schedule moved; the rest of the rows are left alone
+        if should_update_task_titles(doc):
+            update_task_titles(doc)
+    elif should_regenerate_tasks(doc):
+        if should_regenerate_in_background(doc):
+            enqueue_regeneration(doc)
+        else:
+            generate_service_tasks(doc)
     elif should_update_task_titles(doc):
         update_task_titles(doc)
     
@@ -77,14 +122,217 @@ def should_regenerate_tasks(doc):
     if not old_doc:
         return False
 
-    critical_fields = [
-        'schedule_type', 'start_date', 'end_date', 'weekly_days',
-        'interval_days', 'task_time', 'default_role', 'duration_hours'
+    return any(_schedule_field_changed(doc, old_doc, field) for field in SCHEDULE_CRITICAL_FIELDS)
+
+def _schedule_field_value(doc, field):
+    value = getattr(doc, field)
+    if field == 'weekly_days':
+        # Child rows have no value equality; compare the selected weekdays
+        return weekday_mask(value)
+    return value
+
+def _schedule_field_changed(doc, old_doc, field):
+    return (hasattr(doc, field) and hasattr(old_doc, field)
+            and _schedule_field_value(doc, field) != _schedule_field_value(old_doc, field))
+
+def is_end_date_only_change(doc):
+    """True when end_date is the only schedule field changed by this save."""
+    if doc.is_new() or not doc.get('materialized_until'):
+        return False
+
+    old_doc = doc.get_doc_before_save()
+    if not old_doc or not _schedule_field_changed(doc, old_doc, 'end_date'):
+        return False
+
+    return not any(
+        _schedule_field_changed(doc, old_doc, field)
+        for field in SCHEDULE_CRITICAL_FIELDS if field != 'end_date'
+    )
+
+def apply_end_date_change(doc):
+    """
+    Fast path for a save that only moved end_date.
+
+    An extension appends the occurrences between `materialized_until` and the
+    new materialization end; a truncation drops the unmodified rows past the
+    new end. Other rows are neither rebuilt nor compared, so the cost follows
+    the size of the change. Returns the summary, or None when the full
+    reconciliation has to run instead (schedule without any bound).
+
+    This still runs inside the project save, which writes every child row;
+    `update_project_end_date` moves the end date without that save.
+    """
+    new_end = get_materialization_end(doc)
+    if not new_end:
+        return None
+
+    materialized_until = getdate(doc.materialized_until)
+    summary = frappe._dict(inserted=0, updated=0, deleted=0, preserved=0)
+
+    if new_end < materialized_until:
+        # Rows left out of doc.service_tasks are deleted by the parent save
+        cutoff = new_end.strftime('%Y-%m-%d')
+        auto_notes = get_auto_notes_variants(doc)
+        kept = []
+        for task in doc.service_tasks:
+            if task and get_task_date_key(task) > cutoff:
+                if is_preserved_task(task, auto_notes):
+                    summary.preserved += 1
+                else:
+                    summary.deleted += 1
+                    continue
+            kept.append(task)
+        doc.service_tasks = kept
+
+    elif new_end > materialized_until:
+        from_date = materialized_until + timedelta(days=1)
+        from_key = from_date.strftime('%Y-%m-%d')
+        existing_keys = {
+            key for key in (get_task_date_key(task) for task in doc.service_tasks if task)
+            if key >= from_key
+        }
+        task_dates = [
+            task_date for task_date in get_task_dates(doc, from_date, new_end)
+            if task_date.strftime('%Y-%m-%d') not in existing_keys
+        ]
+
+        # Written in bulk by flush_pending_tasks, after the rows already on the project
+        next_idx = max((cint(task.idx) for task in doc.service_tasks if task), default=0) + 1
+        pending = [frappe._dict(row) for row in build_task_rows(doc, task_dates).values()]
+        for idx, row in enumerate(pending, start=next_idx):
+            row.idx = idx
+
+        doc.flags.pending_task_rows = pending
+        summary.inserted = len(pending)
+
+    doc.materialized_until = new_end
+
+    if summary.inserted or summary.deleted:
+        frappe.msgprint(
+            _("Successfully updated tasks: {0} new, {1} updated, {2} removed, {3} preserved (manually modified)").format(
+                summary.inserted, summary.updated, summary.deleted, summary.preserved
+            ),
+            indicator="green"
+        )
+
+    return summary
+
+@frappe.whitelist()
+def update_project_end_date(project_name, end_date=None):
+    """
+    Move a project's end_date without saving the project document.
+
+    A form save writes every service_tasks row again (Frappe updates the whole
+    child table), so its cost grows with the project even on the fast path of
+    `apply_end_date_change`. Here only the schedule fields are read, the rows
+    past the old or new end are inserted or deleted directly, and end_date and
+    materialized_until are written with a single UPDATE.
+    """
+    from service_planner.server_script.virtual_tasks import get_schedule_projects
+
+    frappe.has_permission("Service Project", "write", project_name, throw=True)
+
+    # Serialize with materialization and other end date changes of the project
+    frappe.db.get_value("Service Project", project_name, "name", for_update=True)
+    projects = get_schedule_projects({"name": project_name, "docstatus": ["<", 2]})
+    if not projects:
+        frappe.throw(_("Project does not exist"), frappe.DoesNotExistError)
+
+    project = projects[0]
+    project.doctype = "Service Project"
+    project.end_date = getdate(end_date) if end_date else None
+    if project.end_date and project.end_date < getdate(project.start_date):
+        frappe.throw(_("End date cannot be before start date"))
+
+    new_end = get_materialization_end(project)
+    if not new_end or not project.materialized_until:
+        # Nothing bounds the schedule: the full reconciliation is needed
+        doc = frappe.get_doc("Service Project", project_name)
+        doc.end_date = project.end_date
+        doc.save()
+        return {"success": True, "message": _("Project updated")}
+
+    materialized_until = getdate(project.materialized_until)
+    summary = frappe._dict(inserted=0, updated=0, deleted=0, preserved=0)
+
+    if new_end < materialized_until:
+        summary.update(delete_tail_tasks(project, new_end))
+    elif new_end > materialized_until:
+        summary.inserted = insert_tail_tasks(project, materialized_until + timedelta(days=1), new_end)
+
+    frappe.db.set_value("Service Project", project_name, {
+        "end_date": project.end_date,
+        "materialized_until": new_end
+    })
+
+    return {
+        "success": True,
+        "message": _("Successfully updated tasks: {0} new, {1} updated, {2} removed, {3} preserved (manually modified)").format(
+            summary.inserted, summary.updated, summary.deleted, summary.preserved
+        )
+    }
+
+def get_tail_task_filters(project_name, from_date):
+    # due_date is UTC: one day of margin covers any timezone offset
+    return {
+        "parenttype": "Service Project",
+        "parent": project_name,
+        "due_date": [">=", from_date - timedelta(days=1)]
+    }
+
+def _get_tail_task_rows(project, from_date):
+    """Task rows of `project` whose local date may fall on or after `from_date`."""
+    return frappe.get_all(
+        "Service Task",
+        filters=get_tail_task_filters(project.name, from_date),
+        fields=["name", "idx", "due_date", "local_due_date", "auto_generated", "assigned_to",
+                "assigned_role", "status", "notes"]
+    )
+
+def delete_tail_tasks(project, new_end):
+    """Delete the unmodified rows past `new_end`; manually modified rows are kept."""
+    cutoff = new_end.strftime('%Y-%m-%d')
+    auto_notes = {generate_task_notes(project).strip()}
+    deleted, preserved = [], 0
+    for task in _get_tail_task_rows(project, new_end):
+        if get_task_date_key(task) <= cutoff:
+            continue
+        if is_preserved_task(task, auto_notes):
+            preserved += 1
+        else:
+            deleted.append(task)
+
+    if deleted:
+        frappe.db.delete("Service Task", {"name": ["in", [task.name for task in deleted]]})
+        invalidate_task_stats(deleted)
+
+    return {"deleted": len(deleted), "preserved": preserved}
+
+def insert_tail_tasks(project, from_date, to_date):
+    """Bulk insert the occurrences in [from_date, to_date] that have no row yet."""
+    from_key = from_date.strftime('%Y-%m-%d')
+    existing_keys = {
+        key for key in (get_task_date_key(task) for task in _get_tail_task_rows(project, from_date))
+        if key >= from_key
+    }
+    task_dates = [
+        task_date for task_date in get_task_dates(project, from_date, to_date)
+        if task_date.strftime('%Y-%m-%d') not in existing_keys
     ]
+    if not task_dates:
+        return 0
+
+    next_idx = cint(frappe.db.sql("""
+        SELECT MAX(idx) FROM `tabService Task`
+        WHERE parenttype = 'Service Project' AND parent = %s
+    """, project.name)[0][0]) + 1
+    rows = list(build_task_rows(project, task_dates).values())
+    for idx, row in enumerate(rows, start=next_idx):
+        row['idx'] = idx
 
-    return any(getattr(doc, field) != getattr(old_doc, field) 
-              for field in critical_fields 
-              if hasattr(doc, field) and hasattr(old_doc, field))
+    records = bulk_insert_task_rows(project, rows)
+    record_task_events(records, EVENT_TASK_CREATED)
+    return len(records)
 
 def should_update_task_titles(doc):
     """Check if only task titles need to be updated (when task_template changes)."""
@@ -106,16 +354,14 @@ def update_task_titles(doc):
     try:
         updated_count = 0
         
-        for task in doc.service_tasks:
-            if not task or not task.auto_generated:
-                continue  # Skip manually created tasks
-            
-            # Get the task date from due_date
-            task_date = getdate(task.due_date)
-            
-            # Generate new title using current template
-            new_title = generate_task_title(doc, task_date)
-            
+        # Skip manually created tasks
+        tasks = [task for task in doc.service_tasks if task and task.auto_generated and task.due_date]
+        
+        # Titles are based on the local date the task was scheduled for
+        task_dates = [getdate(task.local_due_date or task.due_date) for task in tasks]
+        
+        # Generate new titles using current template
+        for task, new_title in zip(tasks, generate_task_titles(doc, task_dates), strict=True):
             # Update only if title actually changed
             if task.task_title != new_title:
                 task.task_title = new_title
@@ -131,59 +377,106 @@ def update_task_titles(doc):
         frappe.log_error(frappe.get_traceback(), "Task Title Update Error")
         frappe.throw(_("Error updating task titles. Please check system logs for details."))
 
-def get_task_dates(doc, start_date, end_date):
-    """Calculate all dates on which tasks should be created based on the schedule."""
-    dates = []
-    current_date = getdate(start_date)
-    end_date = getdate(end_date) if doc.end_date else None
-    max_days = 365 * 2  # Safety limit to prevent infinite loops
+def get_task_dates(doc, start_date, end_date, limit=MAX_TASK_DATES):
+    """Calculate all dates on which tasks should be created based on the schedule.
 
-    while (not end_date or current_date <= end_date) and len(dates) < max_days:
-        if doc.schedule_type == "Daily":
-            dates.append(current_date)
-            current_date = add_days(current_date, 1)
-
-        elif doc.schedule_type == "Weekly" and hasattr(doc, 'weekly_days'):
-            if is_selected_weekday(doc, current_date):
-                dates.append(current_date)
-            current_date = add_days(current_date, 1)
-
-        elif doc.schedule_type == "Every X Days":
-            dates.append(current_date)
-            interval = max(1, int(doc.interval_days or 1))
-            current_date = add_days(current_date, interval)
-
-        else:
-            current_date = add_days(current_date, 1)
+    Occurrences are computed directly from the project's recurrence rule, so the
+    cost is proportional to the number of dates returned. `limit` caps open-ended
+    windows (no `end_date` on the call or on the project).
+    """
+    rule = RecurrenceRule.from_doc(doc)
+    end_date = getdate(end_date) if end_date else None
+    if end_date or rule.end:
+        limit = None
 
-    return dates
+    return rule.dates_between(start_date, end_date, limit=limit)
 
 def is_selected_weekday(doc, date_obj):
     """Check if the day of the week for a given date is in the selected weekdays."""
     if not hasattr(doc, 'weekly_days') or not doc.weekly_days:
         return False
     
-    weekday = calendar.day_name[date_obj.weekday()]
-    return any(d.day == weekday for d in doc.weekly_days)
+    return bool(weekday_mask(doc.weekly_days) & (1 << date_obj.weekday()))
+
+# Placeholders available to task templates
+TASK_TEMPLATE_FIELDS = ('date', 'project', 'organization')
+
+def format_task_date(task_date):
+    """Format a date as dd-MM-yyyy (same output as format_datetime(task_date, "dd-MM-yyyy"))."""
+    return f"{task_date.day:02d}-{task_date.month:02d}-{task_date.year:04d}"
+
+def _apply_conversion(value, conversion):
+    if conversion == 'r':
+        return repr(value)
+    if conversion == 'a':
+        return ascii(value)
+    if conversion == 's':
+        return str(value)
+    return value
+
+@lru_cache(maxsize=256)
+def compile_task_template(template):
+    """
+    Compile a task template into a renderer taking the placeholder values as a dict.
+
+    The template is split into literal and field segments once and cached by its
+    text. Templates using anything beyond plain `{date}`/`{project}`/`{organization}`
+    fields (attribute access, nested format specs, ...) are rendered with str.format.
+    Returns None for templates str.format cannot parse.
+    """
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError:
+        return None
+
+    segments = []
+    for literal, field_name, format_spec, conversion in parsed:
+        if field_name is not None and (
+            field_name not in TASK_TEMPLATE_FIELDS or '{' in (format_spec or '')
+        ):
+            return lambda values: template.format(**values)
+        segments.append((literal, field_name, format_spec, conversion))
+
+    def render(values):
+        parts = []
+        for literal, field_name, format_spec, conversion in segments:
+            parts.append(literal)
+            if field_name is not None:
+                value = _apply_conversion(values[field_name], conversion)
+                parts.append(format(value, format_spec) if format_spec else str(value))
+        return ''.join(parts)
+
+    return render
+
+def generate_task_titles(doc, task_dates):
+    """Generate the titles of several task dates at once, compiling the template only once."""
+    template = getattr(doc, 'task_template', None)
+    renderer = compile_task_template(template) if template else None
+    project = doc.project_name or ""
+    organization = doc.organization or ""
+    default_prefix = doc.project_name or 'Task'
+
+    titles = []
+    for task_date in task_dates:
+        date_str = format_task_date(task_date)
+        title = None
+        if renderer:
+            try:
+                # Use the task template with dynamic replacements
+                title = renderer({'date': date_str, 'project': project, 'organization': organization})
+            except Exception:
+                # If template formatting fails, fall back to default
+                title = None
+        if title is None:
+            # Default title format
+            title = f"{default_prefix} - {date_str}"
+        titles.append(title[:140])  # Ensure title length is within limits
+
+    return titles
 
 def generate_task_title(doc, task_date):
     """Generate a title for the task using template if available."""
-    try:
-        if getattr(doc, 'task_template', None):
-            # Use the task template with dynamic replacements
-            title = doc.task_template.format(
-                date=format_datetime(task_date, "dd-MM-yyyy"),
-                project=doc.project_name or "",
-                organization=doc.organization or ""
-            )
-            return title[:140]  # Ensure title length is within limits
-    except Exception:
-        # If template formatting fails, fall back to default
-        pass
-    
-    # Default title format
-    default_title = f"{doc.project_name or 'Task'} - {format_datetime(task_date, 'dd-MM-yyyy')}"
-    return default_title[:140]
+    return generate_task_titles(doc, [task_date])[0]
 
 def parse_task_time(time_str) -> time:
     """Parse a time string into a time object with robust validation."""
@@ -209,8 +502,12 @@ def parse_task_time(time_str) -> time:
     
     return default_time
 
-def has_manual_modifications(task):
-    """Check if a task has been manually modified by the user."""
+def has_manual_modifications(task, auto_notes=None):
+    """Check if a task has been manually modified by the user.
+
+    `auto_notes` is the set of note texts the generator could have produced for
+    this task; when omitted the legacy comparison format is used.
+    """
     # A task is considered manually modified if:
     # 1. It has an assigned_to user (manual assignment)
     # 2. Its status is not 'Pending' (user changed status)
@@ -227,8 +524,9 @@ def has_manual_modifications(task):
         return True
     
     # Check if notes contain more than just the auto-generated content
-    auto_notes = generate_task_notes_for_comparison(task)
-    if task.notes and task.notes.strip() != auto_notes.strip():
+    if auto_notes is None:
+        auto_notes = {generate_task_notes_for_comparison(task).strip()}
+    if task.notes and task.notes.strip() not in auto_notes:
         return True
     
     return False
@@ -242,116 +540,367 @@ def generate_task_notes_for_comparison(task):
     ]
     return "\n".join(notes)
 
-def generate_service_tasks(doc):
+# Fields owned by the generator; anything else on a row belongs to the user
+AUTO_TASK_FIELDS = (
+    'task_title', 'due_date', 'due_date_utc', 'local_due_date', 'assigned_role',
+    'organization', 'notes', 'notes_text', 'duration_hours', 'user_timezone'
+)
+
+def get_task_date_key(task):
+    """Key a task row by its local calendar date (the date the schedule produced)."""
+    return getdate(task.get('local_due_date') or task.get('due_date')).strftime('%Y-%m-%d')
+
+def get_auto_notes_variants(doc):
+    """Notes the generator may have written for rows of this project, before and after the edit."""
+    variants = {generate_task_notes(doc).strip()}
+    old_doc = None if doc.is_new() else doc.get_doc_before_save()
+    if old_doc:
+        variants.add(generate_task_notes(old_doc).strip())
+    return variants
+
+def is_preserved_task(task, auto_notes):
+    """Completed, in-progress and manually modified rows are never rewritten by the generator."""
+    return task.status in ['Completed', 'In Progress'] or has_manual_modifications(task, auto_notes)
+
+def build_task_rows(doc, task_dates):
+    """Prepare the generated row values for every scheduled date, keyed by local date."""
+    task_time = parse_task_time(doc.task_time)
+
+    # Tasks are scheduled in the timezone of the user creating or editing the project.
+    creator_user = doc.owner or frappe.session.user
+    creator_tz_str = tz_manager.get_user_timezone(creator_user)
+    creator_tz = pytz.timezone(creator_tz_str)
+
+    notes = generate_task_notes(doc)
+    notes_text = get_notes_text(notes)
+    titles = generate_task_titles(doc, task_dates)
+    rows = {}
+
+    # Convert all local times to UTC in one pass over the timezone's DST transitions.
+    naive_dts = [datetime.combine(task_date, task_time) for task_date in task_dates]
+    utc_dts = shared_tz_manager.convert_many_to_utc(creator_tz, naive_dts)
+
+    for task_date, naive_dt, due_date_for_db, title in zip(task_dates, naive_dts, utc_dts, titles, strict=True):
+        rows[task_date.strftime('%Y-%m-%d')] = {
+            'task_title': title,
+            'due_date': due_date_for_db,  # UTC time
+            'due_date_utc': due_date_for_db,  # Same value for consistency
+            'local_due_date': naive_dt,
+            'assigned_role': doc.default_role,
+            'status': 'Pending',
+            'organization': doc.organization,
+            'notes': notes,
+            'notes_text': notes_text,
+            'duration_hours': doc.duration_hours or 1.0,
+            'user_timezone': creator_tz_str,
+            'auto_generated': 1,  # Mark as auto-generated
+        }
+
+    return rows
+
+def _field_differs(fieldname, current, expected):
+    if fieldname in ('due_date', 'due_date_utc', 'local_due_date'):
+        return (get_datetime(current) if current else None) != expected
+    if fieldname == 'duration_hours':
+        return flt(current) != flt(expected)
+    return (current or None) != (expected or None)
+
+def reconcile_service_tasks(doc, task_dates, previous_notes=None):
+    """
+    Bring `doc.service_tasks` in line with `task_dates` by diffing rows keyed by date.
+
+    Untouched auto-generated rows that are still scheduled keep their identity and
+    only get the generator-owned fields that actually changed; rows for dates that
+    left the schedule are dropped and only missing dates are appended. Preserved
+    (completed, in-progress or manually modified) rows are always kept as-is.
+    `previous_notes` are the generated notes from before the edit when the
+    document being reconciled is no longer in its save cycle.
+    """
+    planned = build_task_rows(doc, task_dates)
+    auto_notes = get_auto_notes_variants(doc)
+    if previous_notes:
+        auto_notes.add(previous_notes.strip())
+    summary = frappe._dict(inserted=0, updated=0, deleted=0, preserved=0)
+
+    existing = [task for task in doc.service_tasks if task]
+    preserved_keys = set()
+    for task in existing:
+        if is_preserved_task(task, auto_notes):
+            preserved_keys.add(get_task_date_key(task))
+
+    kept = []
+    covered = set(preserved_keys)
+
+    for task in existing:
+        if is_preserved_task(task, auto_notes):
+            kept.append(task)
+            summary.preserved += 1
+            continue
+
+        key = get_task_date_key(task)
+        row = planned.get(key)
+        if row is None or key in covered:
+            # No longer scheduled, or a duplicate of a row we already kept
+            summary.deleted += 1
+            continue
+
+        changed = False
+        for fieldname in AUTO_TASK_FIELDS:
+            if _field_differs(fieldname, task.get(fieldname), row[fieldname]):
+                task.set(fieldname, row[fieldname])
+                changed = True
+        if changed:
+            task.flags.due_date_is_utc = True
+            summary.updated += 1
+
+        kept.append(task)
+        covered.add(key)
+
+    doc.service_tasks = kept
+
+    # New rows are not appended to the document: they are written in bulk from
+    # the on_update hook (flush_pending_tasks) instead of one INSERT per row.
+    pending = [frappe._dict(row) for key, row in planned.items() if key not in covered]
+    summary.inserted = len(pending)
+
+    ordered = sorted(kept + pending, key=lambda x: get_datetime(x.get('due_date')))
+    for idx, task in enumerate(ordered, start=1):
+        task.idx = idx
+
+    doc.flags.pending_task_rows = pending
+    return summary
+
+def bulk_insert_task_rows(doc, rows):
+    """
+    Write generated rows of `doc` with multi-row INSERTs, bypassing per-row validation.
+
+    Rows come fully computed from `build_task_rows` (due dates already UTC, timezone
+    and local date set), so there is nothing left for ServiceTask.validate to fill in.
+    Returns the inserted records.
+    """
+    if not rows:
+        return []
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    records = []
+
+    for row in rows:
+        record = frappe._dict(row)
+        record.update({
+            'name': frappe.generate_hash(length=10),
+            'creation': now,
+            'modified': now,
+            'owner': user,
+            'modified_by': user,
+            'docstatus': doc.docstatus,
+            'parent': doc.name,
+            'parenttype': doc.doctype,
+            'parentfield': 'service_tasks',
+            'idx': row.get('idx') or 0,
+            'priority': row.get('priority') or 'Medium',
+        })
+        records.append(record)
+
+    # bulk_insert writes raw columns: drop keys that are not columns of the table (e.g. due_date_utc)
+    valid_columns = set(frappe.get_meta("Service Task").get_valid_columns())
+    fields = [field for field in records[0] if field in valid_columns]
+    frappe.db.bulk_insert(
+        "Service Task",
+        fields,
+        [tuple(record.get(field) for field in fields) for record in records],
+        chunk_size=TASK_INSERT_CHUNK_SIZE
+    )
+    invalidate_task_stats(records)
+
+    return records
+
+def flush_pending_tasks(doc, method=None):
+    """on_update hook: insert the rows queued by `reconcile_service_tasks` in bulk."""
+    rows = doc.flags.pop('pending_task_rows', None)
+    if not rows:
+        return
+
+    records = bulk_insert_task_rows(doc, rows)
+    for record in records:
+        doc.append('service_tasks', record)
+
+    doc.service_tasks.sort(key=lambda x: x.idx or 0)
+
+    # Role members are notified in the background, one coalesced message per user
+    record_task_events(records, EVENT_TASK_CREATED)
+
+def get_horizon_weeks(doc):
+    """Weeks of tasks to materialize ahead of today (0 means the whole schedule)."""
+    if cint(doc.get('horizon_weeks')) > 0:
+        return cint(doc.horizon_weeks)
+    return cint(frappe.conf.get("service_planner_horizon_weeks", DEFAULT_HORIZON_WEEKS))
+
+def get_materialization_end(doc):
+    """Last date that should have real task rows: the rolling horizon, clipped to end_date."""
+    end_date = getdate(doc.end_date) if doc.end_date else None
+    horizon_weeks = get_horizon_weeks(doc)
+    if horizon_weeks <= 0:
+        return end_date
+
+    # "Today" is evaluated in the creator's timezone, the same one the tasks are scheduled in
+    creator_tz = pytz.timezone(tz_manager.get_user_timezone(doc.owner or frappe.session.user))
+    today = datetime.now(creator_tz).date()
+    horizon_end = max(today, getdate(doc.start_date)) + timedelta(weeks=horizon_weeks)
+
+    return min(horizon_end, end_date) if end_date else horizon_end
+
+def generate_service_tasks(doc, previous_notes=None):
     """
     The main function to generate tasks with correct UTC and local time handling.
-    It preserves manually modified tasks while updating auto-generated ones.
+    It reconciles the existing rows with the schedule, preserving manually
+    modified tasks and only touching rows whose scheduled values changed.
+    Only the rolling horizon is materialized; `extend_task_horizons` moves it forward.
     """
     try:
-        # Step 1: Preserve ALL existing tasks that have been manually modified
-        # This includes completed, in-progress, and pending tasks with manual changes
-        preserved_tasks = {}
-        manually_modified_tasks = []
-        
-        for task in doc.service_tasks:
-            if not task:
-                continue
-                
-            task_date_str = getdate(task.due_date).strftime('%Y-%m-%d')
-            
-            # Always preserve completed and in-progress tasks
-            if task.status in ['Completed', 'In Progress']:
-                preserved_tasks[task_date_str] = task
-                manually_modified_tasks.append(task)
-            # Also preserve pending tasks that have been manually modified
-            elif has_manual_modifications(task):
-                preserved_tasks[task_date_str] = task
-                manually_modified_tasks.append(task)
-
-        # Step 2: Clear the existing task list in the document. We will rebuild it.
-        doc.service_tasks = []
-
-        # Step 3: Get the schedule parameters from the parent document.
         start_date = getdate(doc.start_date)
-        end_date = getdate(doc.end_date) if doc.end_date else None
+        end_date = get_materialization_end(doc)
         task_dates = get_task_dates(doc, start_date, end_date)
-        task_time = parse_task_time(doc.task_time)
-        
-        # Step 4: Determine the timezone of the user creating or editing the project.
-        creator_user = doc.owner or frappe.session.user
-        creator_tz_str = tz_manager.get_user_timezone(creator_user)
-        creator_tz = pytz.timezone(creator_tz_str)
-
-        # Step 5: Loop through each calculated date to create or re-add tasks.
-        for task_date in task_dates:
-            task_date_str = task_date.strftime('%Y-%m-%d')
-            
-            # If a task for this day already exists and has been preserved, re-add it
-            if task_date_str in preserved_tasks:
-                doc.append('service_tasks', preserved_tasks[task_date_str])
-                continue
 
-            # --- Core Timezone Logic for New Tasks ---
+        summary = reconcile_service_tasks(doc, task_dates, previous_notes=previous_notes)
+        doc.materialized_until = end_date or (task_dates[-1] if task_dates else None)
 
-            # 5a. Create a "naive" datetime object (without timezone info) from the date and time.
-            naive_dt = datetime.combine(task_date, task_time)
-            
-            # 5b. Make this datetime "aware" by localizing it to the creator's timezone.
-            # pytz will automatically handle DST if applicable!
-            creator_aware_dt = creator_tz.localize(naive_dt)
-
-            # 5c. Convert this local reference time to UTC for storage.
-            utc_dt = creator_aware_dt.astimezone(pytz.utc)
-
-            # 5d. The `local_due_date` will be the creator's aware time.
-            local_dt = creator_aware_dt
-
-            # 5e. Remove timezone info for database storage
-            due_date_for_db = utc_dt.replace(tzinfo=None)
-            local_due_date_for_db = local_dt.replace(tzinfo=None)
-
-            # 5f. Prepare the dictionary with all data for the new task.
-            task_data = {
-                'task_title': generate_task_title(doc, task_date),
-                'due_date': due_date_for_db,  # UTC time
-                'due_date_utc': due_date_for_db,  # Same value for consistency
-                'local_due_date': local_due_date_for_db,
-                'assigned_role': doc.default_role,
-                'status': 'Pending',
-                'organization': doc.organization,
-                'notes': generate_task_notes(doc),
-                'duration_hours': doc.duration_hours or 1.0,
-                'user_timezone': creator_tz_str,
-                'auto_generated': 1,  # Mark as auto-generated
-                # Important: Add flag to indicate due_date is already UTC
-                'flags': {'due_date_is_utc': True}
-            }
-            
-            # 5g. Append the new task to the document's child table.
-            doc.append('service_tasks', task_data)
-
-        # Step 6: Sort the final list of tasks by their due date.
-        doc.service_tasks.sort(key=lambda x: x.due_date)
-        
-        # Step 7: Inform the user about the operation results.
-        total_tasks = len(doc.service_tasks)
-        preserved_count = len(manually_modified_tasks)
-        new_count = total_tasks - preserved_count
-        
-        if preserved_count > 0:
+        if summary.inserted or summary.updated or summary.deleted:
             frappe.msgprint(
-                _("Successfully updated tasks: {0} new, {1} preserved (manually modified)").format(
-                    new_count, preserved_count
-                ), 
+                _("Successfully updated tasks: {0} new, {1} updated, {2} removed, {3} preserved (manually modified)").format(
+                    summary.inserted, summary.updated, summary.deleted, summary.preserved
+                ),
                 indicator="green"
             )
-        else:
-            frappe.msgprint(_("Successfully updated {0} tasks").format(total_tasks), indicator="green")
+
+        return summary
 
     except Exception:
         frappe.log_error(frappe.get_traceback(), "Task Generation Error")
         frappe.throw(_("Error during task generation. Please check system logs for details."))
 
+def count_scheduled_occurrences(doc):
+    """O(1) count of the occurrences a regeneration would materialize."""
+    rule = RecurrenceRule.from_doc(doc)
+    if rule.is_empty:
+        return 0
+
+    end_date = get_materialization_end(doc)
+    if not end_date:
+        return MAX_TASK_DATES
+    return rule.count_between(doc.start_date, end_date)
+
+def should_regenerate_in_background(doc):
+    """Large regenerations are moved off the web request."""
+    if doc.flags.in_background_regeneration:
+        return False
+
+    threshold = cint(frappe.conf.get(
+        "service_planner_background_regeneration_threshold", DEFAULT_BACKGROUND_REGENERATION_THRESHOLD
+    ))
+    return threshold > 0 and count_scheduled_occurrences(doc) > threshold
+
+def enqueue_regeneration_job(project_name, previous_notes=None):
+    """Queue `regenerate_in_background` on the long queue, once per project, after commit."""
+    frappe.enqueue(
+        "service_planner.server_script.auto_generate_tasks.regenerate_in_background",
+        queue="long",
+        timeout=1500,
+        job_id=f"service_project_regeneration::{project_name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        project_name=project_name,
+        previous_notes=previous_notes
+    )
+
+def enqueue_regeneration(doc):
+    """Mark the project as pending and regenerate its tasks in the background (called from before_save)."""
+    old_doc = None if doc.is_new() else doc.get_doc_before_save()
+    doc.regeneration_status = "Pending"
+    enqueue_regeneration_job(doc.name, generate_task_notes(old_doc) if old_doc else None)
+
+    frappe.msgprint(
+        _("Tasks are being regenerated in the background. You will be notified when they are ready."),
+        indicator="blue",
+        alert=True
+    )
+
+def regenerate_in_background(project_name, previous_notes=None):
+    """Background job: regenerate a project's tasks and notify open forms when done. Returns the final status."""
+    try:
+        doc = frappe.get_doc("Service Project", project_name)
+        doc.flags.in_background_regeneration = True
+
+        generate_service_tasks(doc, previous_notes=previous_notes)
+        doc.regeneration_status = "Complete"
+        doc.save(ignore_permissions=True)
+        status = "Complete"
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), f"Background Task Regeneration Error: {project_name}")
+        frappe.db.set_value("Service Project", project_name, "regeneration_status", "Failed", update_modified=False)
+        status = "Failed"
+
+    frappe.db.commit()
+    frappe.publish_realtime(
+        REGENERATION_COMPLETE_EVENT,
+        {"project": project_name, "status": status},
+        doctype="Service Project",
+        docname=project_name
+    )
+    return status
+
+def extend_project_horizon(project_name):
+    """Materialize the occurrences between a project's `materialized_until` and its new horizon end."""
+    doc = frappe.get_doc("Service Project", project_name)
+    new_end = get_materialization_end(doc)
+    if not new_end:
+        return 0
+
+    last_date = getdate(doc.materialized_until) if doc.materialized_until else None
+    if last_date and new_end <= last_date:
+        return 0
+
+    from_date = last_date + timedelta(days=1) if last_date else getdate(doc.start_date)
+    existing_keys = {get_task_date_key(task) for task in doc.service_tasks}
+    task_dates = [
+        task_date for task_date in get_task_dates(doc, from_date, new_end)
+        if task_date.strftime('%Y-%m-%d') not in existing_keys
+    ]
+
+    next_idx = len(doc.service_tasks) + 1
+    rows = list(build_task_rows(doc, task_dates).values())
+    for idx, row in enumerate(rows, start=next_idx):
+        row['idx'] = idx
+
+    records = bulk_insert_task_rows(doc, rows)
+
+    # Same outbox events as flush_pending_tasks: notifications, realtime deltas and stats
+    record_task_events(records, EVENT_TASK_CREATED)
+
+    doc.db_set('materialized_until', new_end, update_modified=False)
+    return len(task_dates)
+
+def extend_task_horizons():
+    """Nightly job: roll every open project's task horizon forward."""
+    projects = frappe.get_all(
+        "Service Project",
+        filters={"docstatus": ["<", 2], "status": ["not in", CLOSED_PROJECT_STATUSES]},
+        fields=["name", "end_date", "materialized_until"]
+    )
+
+    for project in projects:
+        if project.end_date and project.materialized_until \
+                and getdate(project.materialized_until) >= getdate(project.end_date):
+            continue
+
+        try:
+            extend_project_horizon(project.name)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), f"Task Horizon Extension Error: {project.name}")
+
 
 def generate_task_notes(doc):
     """Generate standardized notes for a task."""
@@ -403,6 +952,15 @@ def regenerate_tasks(project_name):
         if not frappe.has_permission("Service Project", "write", doc):
             frappe.throw(_("You don't have permission to modify this project"))
 
+        if should_regenerate_in_background(doc):
+            doc.db_set("regeneration_status", "Pending", update_modified=False)
+            enqueue_regeneration_job(doc.name)
+            return {
+                "success": True,
+                "queued": True,
+                "message": _("Tasks are being regenerated in the background")
+            }
+
         generate_service_tasks(doc)
         doc.save()
 
@@ -418,20 +976,55 @@ def regenerate_tasks(project_name):
             "error": frappe.get_traceback()
         }
 
+def encode_preview_cursor(next_date):
+    """Opaque cursor pointing at the next occurrence of a preview page."""
+    return base64.urlsafe_b64encode(next_date.strftime('%Y-%m-%d').encode()).decode()
+
+def decode_preview_cursor(cursor):
+    try:
+        return getdate(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+
 @frappe.whitelist()
-def preview_next_tasks(project_name, days=7):
-    """Preview upcoming tasks for the next X days"""
+def preview_next_tasks(project_name, days=7, from_date=None, to_date=None, page_length=DEFAULT_PREVIEW_PAGE_LENGTH, cursor=None):
+    """
+    Preview upcoming occurrences one page at a time.
+
+    The window defaults to the next `days` days; pass `from_date`/`to_date` for
+    an explicit range. Only the schedule fields of the project are read and the
+    occurrences are produced lazily, so the window can be arbitrarily large.
+    Pass the returned `next_cursor` back as `cursor` to get the following page.
+    """
+    from service_planner.server_script.virtual_tasks import get_schedule_projects
+
     try:
-        doc = frappe.get_doc("Service Project", project_name)
-        start_date = getdate(nowdate())
-        end_date = add_days(start_date, int(days))
+        projects = get_schedule_projects({"name": project_name})
+        if not projects:
+            frappe.throw(_("Service Project {0} not found").format(project_name), frappe.DoesNotExistError)
+        if not frappe.has_permission("Service Project", "read", project_name):
+            frappe.throw(_("You don't have permission to view this project"), frappe.PermissionError)
 
-        task_dates = get_task_dates(doc, start_date, end_date)
+        start_date = getdate(from_date) if from_date else getdate(nowdate())
+        end_date = getdate(to_date) if to_date else add_days(start_date, cint(days))
+        page_length = min(max(cint(page_length) or DEFAULT_PREVIEW_PAGE_LENGTH, 1), MAX_PREVIEW_PAGE_LENGTH)
+
+        rule = RecurrenceRule.from_doc(projects[0])
+        page_start = max(decode_preview_cursor(cursor), start_date) if cursor else start_date
+
+        # Fetch one extra occurrence to know whether another page exists
+        task_dates = rule.dates_between(page_start, end_date, limit=page_length + 1)
+        next_cursor = None
+        if len(task_dates) > page_length:
+            next_cursor = encode_preview_cursor(task_dates[page_length])
+            task_dates = task_dates[:page_length]
 
         return {
             "success": True,
-            "dates": [format_datetime(d, "yyyy-MM-dd") for d in task_dates],
-            "count": len(task_dates)
+            "dates": [d.strftime('%Y-%m-%d') for d in task_dates],
+            "count": len(task_dates),
+            "total": rule.count_between(start_date, end_date),
+            "next_cursor": next_cursor
         }
     except Exception as e:
         return {
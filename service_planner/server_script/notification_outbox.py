@@ -0,0 +1,195 @@
+import frappe
+from frappe.utils import escape_html
+
+from service_planner.server_script.task_notifications import (
+    bulk_insert_notification_logs, get_enabled_role_members, get_enabled_users, publish_task_deltas
+)
+
+EVENT_DOCTYPE = "Service Notification Event"
+
+EVENT_TASK_CREATED = "Task Created"
+EVENT_TASK_UPDATED = "Task Updated"
+EVENT_TASK_ASSIGNED = "Task Assigned"
+
+EVENT_FIELDS = (
+    "event_type", "task", "project", "organization", "task_title", "due_date", "status",
+    "assigned_role", "assigned_to"
+)
+
+# Events dispatched per batch; the consumer keeps going while full batches come back
+OUTBOX_BATCH_SIZE = 2000
+OUTBOX_JOB_ID = "service_planner_notification_outbox"
+
+
+def _event_values(task, event_type):
+    return (
+        event_type,
+        task.get("name"),
+        task.get("parent") if task.get("parenttype") in (None, "Service Project") else None,
+        task.get("organization"),
+        task.get("task_title"),
+        task.get("due_date"),
+        task.get("status"),
+        task.get("assigned_role"),
+        task.get("assigned_to"),
+    )
+
+
+def record_task_events(tasks, event_type=EVENT_TASK_UPDATED):
+    """تسجيل أحداث المهام في صندوق الصادر (INSERT واحد متعدد الصفوف) وجدولة الإرسال"""
+    tasks = [task for task in tasks if task.get("assigned_role") or task.get("assigned_to")]
+    if not tasks:
+        return
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    fields = ["name", "creation", "modified", "owner", "modified_by", *EVENT_FIELDS]
+    values = [
+        (frappe.generate_hash(length=10), now, now, user, user, *_event_values(task, event_type))
+        for task in tasks
+    ]
+    frappe.db.bulk_insert(EVENT_DOCTYPE, fields, values, chunk_size=OUTBOX_BATCH_SIZE)
+
+    enqueue_outbox_dispatch()
+
+
+def record_task_event(doc, method=None):
+    """
+    doc_events hook: يسجل حدثاً مختصراً فقط، والإرسال يتم في الخلفية
+
+    The only producer of Service Task events: an insert also runs on_update,
+    which is skipped here so one save records one event.
+    """
+    if method == "on_update" and doc.flags.in_insert:
+        return
+    if method == "after_insert":
+        event_type = EVENT_TASK_CREATED
+    elif not doc.is_new() and doc.has_value_changed("assigned_to") and doc.assigned_to:
+        event_type = EVENT_TASK_ASSIGNED
+    else:
+        event_type = EVENT_TASK_UPDATED
+    record_task_events([doc], event_type)
+
+
+def enqueue_outbox_dispatch():
+    frappe.enqueue(
+        "service_planner.server_script.notification_outbox.dispatch_notification_outbox",
+        queue="short",
+        job_id=OUTBOX_JOB_ID,
+        deduplicate=True,
+        enqueue_after_commit=True
+    )
+
+
+def coalesce_events(events):
+    """دمج أحداث نفس المهمة: أحدث بيانات للمهمة مع الإبقاء على نوع "إنشاء" إن وجد"""
+    tasks = {}
+    for event in events:
+        previous = tasks.get(event.task)
+        if previous and EVENT_TASK_CREATED in (previous.event_type, event.event_type):
+            event.event_type = EVENT_TASK_CREATED
+        tasks[event.task] = event
+    return list(tasks.values())
+
+
+def get_event_recipients(tasks):
+    """{user: [tasks]} لكل المهام باستعلامين فقط"""
+    role_members = get_enabled_role_members({t.assigned_role for t in tasks if t.assigned_role})
+    assigned_users = get_enabled_users(t.assigned_to for t in tasks if t.assigned_to)
+
+    tasks_by_user = {}
+    for task in tasks:
+        users = set()
+        # إشعار التعيين يذهب للمستخدم المعين فقط
+        if task.event_type != EVENT_TASK_ASSIGNED:
+            users.update(role_members.get(task.assigned_role, ()))
+        if task.assigned_to in assigned_users:
+            users.add(task.assigned_to)
+        for user in users:
+            tasks_by_user.setdefault(user, []).append(task)
+    return tasks_by_user
+
+
+def build_event_message(tasks):
+    if len(tasks) == 1:
+        task = tasks[0]
+        heading = "📌 <b>تم تعيين مهمة لك:</b>" if task.event_type == EVENT_TASK_ASSIGNED \
+            else "📌 <b>تم إنشاء أو تعديل مهمة:</b>"
+        return f"""
+            {heading}<br>
+            <b>العنوان:</b> {escape_html(task.task_title or task.task)}<br>
+            <b>التاريخ:</b> {task.due_date}
+        """
+
+    rows = "".join(
+        f"<li>{escape_html(task.task_title or task.task)} - {task.due_date}</li>"
+        for task in sorted(tasks, key=lambda t: str(t.due_date or ""))
+    )
+    return f"""
+        📌 <b>مهام جديدة أو محدثة ({len(tasks)}):</b><br>
+        <ul>{rows}</ul>
+    """
+
+
+def dispatch_notification_outbox():
+    """مستهلك الخلفية: يدمج الأحداث لكل مهمة ولكل مستخدم ثم يرسل إشعاراً واحداً لكل مستخدم"""
+    while dispatch_outbox_batch() >= OUTBOX_BATCH_SIZE:
+        pass
+
+
+def dispatch_outbox_batch():
+    events = frappe.db.sql(f"""
+        SELECT name, {", ".join(EVENT_FIELDS)}
+        FROM `tab{EVENT_DOCTYPE}`
+        ORDER BY creation ASC
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    """, {"limit": OUTBOX_BATCH_SIZE}, as_dict=True)
+    if not events:
+        return 0
+
+    tasks = coalesce_events(events)
+    tasks_by_user = get_event_recipients(tasks)
+
+    logs = []
+    for user, user_tasks in tasks_by_user.items():
+        message = build_event_message(user_tasks)
+        subject = f"📋 مهمة: {user_tasks[0].task_title}" if len(user_tasks) == 1 \
+            else f"📋 {len(user_tasks)} مهام جديدة أو محدثة"
+        projects = {task.project for task in user_tasks}
+        project = projects.pop() if len(projects) == 1 else None
+
+        # بريد إلكتروني
+        frappe.sendmail(
+            recipients=[user],
+            subject=subject,
+            message=message,
+            reference_doctype="Service Project" if project else None,
+            reference_name=project
+        )
+
+        # إشعار داخل النظام 🔔
+        logs.append({
+            "subject": subject,
+            "email_content": message,
+            "for_user": user,
+            "document_type": "Service Project" if project else None,
+            "document_name": project
+        })
+
+    bulk_insert_notification_logs(logs)
+
+    # إشعار فوري: حدث واحد لكل مؤسسة يحمل التغييرات المختصرة
+    publish_task_deltas([
+        frappe._dict(
+            name=task.task, parent=task.project, organization=task.organization,
+            task_title=task.task_title, due_date=task.due_date, status=task.status,
+            assigned_role=task.assigned_role, assigned_to=task.assigned_to
+        )
+        for task in tasks
+    ])
+
+    frappe.db.delete(EVENT_DOCTYPE, {"name": ["in", [event.name for event in events]]})
+    frappe.db.commit()
+
+    return len(events)
@@ -1,14 +1,15 @@
 import frappe
+from service_planner.utils.role_index import get_user_info, get_user_roles
 
 def get_permission_query_conditions(user, doctype=None):
     # صلاحيات خاصة بـ Service Project
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user):
+    if "System Manager" in get_user_roles(user):
         return ""
 
-    user_org = frappe.db.get_value("User", user, "organization")
+    user_org = get_user_info(user).organization
     if not user_org:
         return "1=0"
 
@@ -20,14 +21,14 @@ def task_permission_query_conditions(user, doctype=None):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user):
+    user_roles = get_user_roles(user)
+    if "System Manager" in user_roles:
         return ""
 
-    user_org = frappe.db.get_value("User", user, "organization")
+    user_org = get_user_info(user).organization
     if not user_org:
         return "1=0"
 
-    user_roles = frappe.get_roles(user)
     role_conditions = []
     for role in ["Engineer", "Analyst", "Account Manager"]:
         if role in user_roles:
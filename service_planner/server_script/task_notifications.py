@@ -1,117 +1,512 @@
 import frappe
-from frappe.utils import nowdate
+from datetime import datetime, time, timedelta
+from frappe.desk.doctype.notification_log.notification_log import set_notifications_as_unseen
+from frappe.utils import cint, escape_html, get_datetime, get_url_to_form, now_datetime, nowdate
+
+from service_planner.utils.role_index import get_role_members, get_user_info, get_user_roles, get_users_info
+from service_planner.utils.timezone_utils import tz_manager
+
+EXCLUDED_RECIPIENTS = ("Guest", "Administrator")
+
+# Rows per multi-row INSERT into Notification Log
+NOTIFICATION_LOG_CHUNK_SIZE = 500
+
+# Recipients per queued email; override with "service_planner_email_batch_size"
+DEFAULT_EMAIL_BATCH_SIZE = 100
+
+# Realtime task changes, published once per (organization, role) room and per assignee
+TASK_DELTA_EVENT = "service_task_delta"
+TASK_DELTA_UPSERT = "upsert"
+TASK_DELTA_REMINDER = "reminder"
+# Rooms joined through realtime/handlers.js: one per (organization, role), plus one for System Managers
+TASK_DELTA_ROOM_PREFIX = "service_task_delta:"
+TASK_DELTA_ADMIN_ROOM = f"{TASK_DELTA_ROOM_PREFIX}all"
+TASK_DELTA_FIELDS = (
+    "name", "parent", "task_title", "due_date", "local_due_date", "status", "assigned_role", "assigned_to"
+)
+
+# Tasks claimed per conditional UPDATE
+CLAIM_CHUNK_SIZE = 500
+
+# Reminders go out this many hours before the due time (same local lead time
+# everywhere); override with "service_planner_reminder_lead_hours"
+DEFAULT_REMINDER_LEAD_HOURS = 24
+
+# A claim newer than this blocks another reminder for the same task
+REMINDER_CLAIM_HOURS = 3
+
+# Reminder delivery, set by the `task_reminder_mode` field of User (or of the
+# user's organization); the site default is "service_planner_task_reminder_mode"
+REMINDER_MODE_PER_TASK = "Per Task"
+REMINDER_MODE_DIGEST = "Daily Digest"
+
+# Digest users get one message per local day, sent by the first hourly run at or
+# after this local hour; override with "service_planner_digest_hour"
+DEFAULT_DIGEST_HOUR = 7
+
+# User default holding the local date of the last digest sent to the user
+LAST_DIGEST_DEFAULT = "service_planner_last_task_digest"
+
+# User default holding the time (system timezone, like `modified`) up to which task
+# changes were delivered to a digest user, by a digest or a catch-up message
+DIGEST_COVERED_UNTIL_DEFAULT = "service_planner_task_digest_covered_until"
 
 def notify_task_update(doc, method=None):
-    recipients = set()
-
-    # 1️⃣ لكل مستخدم لديه نفس الدور المعين
-    if doc.assigned_role:
-        role_users = frappe.get_all(
-            "Has Role",
-            filters={"role": doc.assigned_role},
-            fields=["parent"]
+    """تسجيل حدث للمهمة؛ الإرسال الفعلي يتم في الخلفية (notification_outbox)"""
+    from service_planner.server_script.notification_outbox import record_task_event
+
+    record_task_event(doc, method)
+
+
+def get_enabled_role_members(roles):
+    """أعضاء كل دور من المستخدمين المفعلين فقط (من فهرس الأدوار المشترك)"""
+    return {
+        role: {user for user in users if user not in EXCLUDED_RECIPIENTS}
+        for role, users in get_role_members(roles).items()
+    }
+
+
+def get_enabled_users(users):
+    """تصفية المستخدمين المعطلين دفعة واحدة"""
+    users = [u for u in set(users) if u and u not in EXCLUDED_RECIPIENTS]
+    return {user for user, info in get_users_info(users).items() if info.enabled}
+
+
+def resolve_task_recipients(tasks):
+    """{task name: [recipients]} لكل المهام باستعلامين فقط"""
+    role_members = get_enabled_role_members({t.assigned_role for t in tasks if t.assigned_role})
+    assigned_users = get_enabled_users(t.assigned_to for t in tasks if t.assigned_to)
+
+    recipients = {}
+    for task in tasks:
+        users = set(role_members.get(task.assigned_role, ()))
+        if task.assigned_to in assigned_users:
+            users.add(task.assigned_to)
+        recipients[task.name] = sorted(users)
+    return recipients
+
+
+def get_task_delta_room(organization, role):
+    """غرفة socket.io لمهام دور داخل مؤسسة"""
+    return f"{TASK_DELTA_ROOM_PREFIX}{organization}:{role}"
+
+
+@frappe.whitelist()
+def get_task_delta_rooms():
+    """
+    الغرف التي يحق للمستخدم الحالي الانضمام إليها (يستدعيها realtime/handlers.js)
+
+    System Managers join the room carrying every task; other users join one
+    room per role they hold in their organization. Directly assigned tasks are
+    delivered on the user's own room, which Frappe joins on connect.
+    """
+    user = frappe.session.user
+    if user == "Guest":
+        return []
+
+    roles = get_user_roles(user)
+    if "System Manager" in roles:
+        return [TASK_DELTA_ADMIN_ROOM]
+
+    organization = get_user_info(user).organization
+    if not organization:
+        return []
+    return [get_task_delta_room(organization, role) for role in roles]
+
+
+def get_delta_targets(tasks):
+    """
+    ({room: [deltas]}, {user: [deltas]}) بنفس قواعد الرؤية في get_my_tasks
+
+    Role tasks go to their (organization, role) room and directly assigned tasks
+    to the assignee; the admin room receives every task, so System Managers are
+    not sent their own assigned tasks a second time.
+    """
+    rooms = {}
+    users = {}
+    all_deltas = []
+    for task in tasks:
+        delta = {field: task.get(field) for field in TASK_DELTA_FIELDS}
+        all_deltas.append(delta)
+        if task.get("assigned_to"):
+            users.setdefault(task.get("assigned_to"), []).append(delta)
+        elif task.get("assigned_role") and task.get("organization"):
+            room = get_task_delta_room(task.get("organization"), task.get("assigned_role"))
+            rooms.setdefault(room, []).append(delta)
+
+    if all_deltas:
+        rooms[TASK_DELTA_ADMIN_ROOM] = all_deltas
+
+    admins = get_role_members(["System Manager"]).get("System Manager", ())
+    users = {user: deltas for user, deltas in users.items() if user not in admins and user != "Guest"}
+    return rooms, users
+
+
+def publish_task_deltas(tasks, action=TASK_DELTA_UPSERT):
+    """
+    نشر تغييرات المهام: حدث واحد لكل غرفة (مؤسسة، دور) ولكل مستخدم معين
+
+    The number of publishes follows the number of distinct (organization, role)
+    pairs and assignees in the batch, not the number of role members.
+    """
+    rooms, users = get_delta_targets(tasks)
+    for room, deltas in rooms.items():
+        frappe.publish_realtime(
+            TASK_DELTA_EVENT,
+            {"action": action, "tasks": deltas},
+            room=room,
+            after_commit=True
+        )
+
+    for user, deltas in users.items():
+        frappe.publish_realtime(
+            TASK_DELTA_EVENT,
+            {"action": action, "tasks": deltas},
+            user=user,
+            after_commit=True
         )
-        for user in role_users:
-            recipients.add(user.parent)
 
-    # 2️⃣ المستخدم المحدد مباشرة في "Assigned To"
-    if doc.assigned_to:
-        recipients.add(doc.assigned_to)
 
-    # 🔃 إزالة المستخدمين غير المرغوبين
-    recipients = [u for u in recipients if u not in ("Guest", "Administrator")]
+def get_digest_users(users):
+    """المستخدمون الذين يستلمون ملخصاً يومياً واحداً بدلاً من تذكير لكل مهمة"""
+    if not users:
+        return set()
+
+    default_mode = frappe.conf.get("service_planner_task_reminder_mode") or REMINDER_MODE_PER_TASK
+    user_rows = frappe.get_all(
+        "User",
+        filters={"name": ["in", list(users)]},
+        fields=["name", "task_reminder_mode", "organization"]
+    )
+
+    organizations = {row.organization for row in user_rows if row.organization and not row.task_reminder_mode}
+    organization_modes = {}
+    if organizations:
+        organization_modes = dict(frappe.get_all(
+            "Company",
+            filters={"name": ["in", list(organizations)]},
+            fields=["name", "task_reminder_mode"],
+            as_list=True
+        ))
+
+    return {
+        row.name for row in user_rows
+        if (row.task_reminder_mode or organization_modes.get(row.organization) or default_mode) == REMINDER_MODE_DIGEST
+    }
+
+
+def build_digest_message(user, tasks):
+    """رسالة واحدة بكل مهام اليوم للمستخدم بتوقيته المحلي"""
+    user_tz = tz_manager.get_user_timezone(user)
+    local_dts = tz_manager.convert_many_to_local(user_tz, [get_datetime(task.due_date) for task in tasks])
+
+    rows = []
+    for local_dt, task in sorted(zip(local_dts, tasks, strict=True), key=lambda item: item[0]):
+        link = get_url_to_form("Service Project", task.parent) if task.parent else None
+        title = escape_html(task.task_title or task.name)
+        if link:
+            title = f'<a href="{link}">{title}</a>'
+        rows.append(f"<li><b>{local_dt.strftime('%H:%M')}</b> - {title}</li>")
+
+    return f"""
+        🕒 <b>مهام قادمة ({len(tasks)}):</b><br>
+        <ul>{"".join(rows)}</ul>
+        <small>التوقيت: {user_tz}</small>
+    """
+
+
+def bulk_insert_notification_logs(logs):
+    """إدراج سجلات Notification Log بعبارات INSERT متعددة الصفوف"""
+    if not logs:
+        return
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    fields = [
+        "name", "creation", "modified", "owner", "modified_by", "subject", "email_content",
+        "for_user", "document_type", "document_name", "type", "read"
+    ]
+    values = [
+        (
+            frappe.generate_hash(length=10), now, now, user, user, log["subject"], log["email_content"],
+            log["for_user"], log["document_type"], log["document_name"], "Alert", 0
+        )
+        for log in logs
+    ]
+    frappe.db.bulk_insert("Notification Log", fields, values, chunk_size=NOTIFICATION_LOG_CHUNK_SIZE)
+
+    # bulk_insert skips Notification Log.after_insert: refresh the desk bell once per recipient
+    for for_user in dict.fromkeys(log["for_user"] for log in logs):
+        frappe.publish_realtime("notification", after_commit=True, user=for_user)
+        set_notifications_as_unseen(for_user)
+
+
+def claim_tasks(task_names, since):
+    """
+    حجز المهام للإرسال بتحديث شرطي على last_notification_sent
+
+    Each chunk is claimed with one conditional UPDATE and committed right away, so a
+    rerun, an overlapping run or another worker skips tasks already notified since
+    `since`. Returns the names claimed by this call; a crash after the claim loses
+    the reminder instead of sending it twice.
+    """
+    claimed = []
+    for i in range(0, len(task_names), CLAIM_CHUNK_SIZE):
+        chunk = task_names[i:i + CLAIM_CHUNK_SIZE]
+        # Datetime(6): the claim time identifies the rows won by this run
+        claim_time = now_datetime()
+        frappe.db.sql("""
+            UPDATE `tabService Task`
+            SET last_notification_sent = %(claim_time)s
+            WHERE name IN %(names)s
+                AND (last_notification_sent IS NULL OR last_notification_sent < %(since)s)
+        """, {"claim_time": claim_time, "names": chunk, "since": since})
+        claimed.extend(frappe.get_all(
+            "Service Task",
+            filters={"name": ["in", chunk], "last_notification_sent": claim_time},
+            pluck="name"
+        ))
+        frappe.db.commit()
+    return claimed
 
-    # 3️⃣ إرسال الإشعارات لكل مستلم
-    if recipients:
+
+REMINDER_TASK_FIELDS = [
+    "name", "parent", "task_title", "assigned_role", "assigned_to", "due_date",
+    "local_due_date", "user_timezone", "status", "organization"
+]
+
+
+def get_due_task_filters(start, end):
+    """المهام المفتوحة المستحقة في [start, end) بتوقيت UTC (مسح نطاق على due_date)"""
+    return [
+        ["due_date", ">=", start],
+        ["due_date", "<", end],
+        ["status", "not in", ["Completed", "Cancelled"]]
+    ]
+
+
+def get_reminder_lead():
+    return timedelta(hours=cint(frappe.conf.get("service_planner_reminder_lead_hours", DEFAULT_REMINDER_LEAD_HOURS)))
+
+
+def get_reminder_window(now_utc=None):
+    """
+    نافذة مواعيد الاستحقاق (UTC) للتشغيل الحالي
+
+    Tasks due `lead` hours after the current UTC hour are reminded now. Since
+    `due_date` is stored in UTC the lead time is the same local lead time in every
+    timezone. The window also covers the previous hour so a late or skipped run is
+    caught up; claims keep those tasks from being reminded twice.
+    """
+    now_utc = now_utc or datetime.utcnow()
+    lead = get_reminder_lead()
+    hour_start = now_utc.replace(minute=0, second=0, microsecond=0)
+    return hour_start + lead - timedelta(hours=1), hour_start + lead + timedelta(hours=1)
+
+
+def notify_scheduled_tasks():
+    """تشغيل كل ساعة لإرسال تذكير بالتاسكات التي يقترب موعدها"""
+    now_utc = datetime.utcnow()
+    send_daily_digests(now_utc)
+
+    window_start, window_end = get_reminder_window(now_utc)
+
+    # مسح نطاق على الفهرس due_date
+    tasks = frappe.get_all(
+        "Service Task",
+        filters=get_due_task_filters(window_start, window_end),
+        fields=REMINDER_TASK_FIELDS
+    )
+    if not tasks:
+        return
+
+    # تجاهل المهام التي أرسل تذكيرها خلال النافذة (إعادة تشغيل أو تشغيل متزامن)
+    since = now_datetime() - timedelta(hours=REMINDER_CLAIM_HOURS)
+    claimed = set(claim_tasks([task.name for task in tasks], since))
+    send_task_reminders([task for task in tasks if task.name in claimed])
+
+
+def send_task_reminders(tasks):
+    """إرسال التذكيرات للمهام المحجوزة"""
+    if not tasks:
+        return
+
+    recipients_by_task = resolve_task_recipients(tasks)
+    digest_users = get_digest_users(set().union(*recipients_by_task.values()))
+    batch_size = cint(frappe.conf.get("service_planner_email_batch_size", DEFAULT_EMAIL_BATCH_SIZE)) or DEFAULT_EMAIL_BATCH_SIZE
+
+    logs = []
+
+    for task in tasks:
+        # مستخدمو الملخص يستلمون مهامهم في الملخص اليومي (send_daily_digests)
+        recipients = [user for user in recipients_by_task.get(task.name, ()) if user not in digest_users]
+        if not recipients:
+            continue
+
+        local_due = task.local_due_date or task.due_date
         message = f"""
-            📌 <b>تم إنشاء أو تعديل مهمة:</b><br>
-            <b>العنوان:</b> {doc.task_title}<br>
-            <b>التاريخ:</b> {doc.due_date}
+            🕒 <b>تذكير بمهمة قادمة:</b><br>
+            <b>المهمة:</b> {task.task_title}<br>
+            <b>التاريخ:</b> {local_due} {task.user_timezone or ""}
         """
-        for user in recipients:
-            # إشعار فوري
-            frappe.publish_realtime(
-                event="task_notification",
-                user=user,
-                message=message
-            )
 
-            # بريد إلكتروني
+        # بريد إلكتروني: رسالة واحدة في الطابور لكل دفعة من المستلمين
+        for i in range(0, len(recipients), batch_size):
             frappe.sendmail(
-                recipients=user,
-                subject="📋 إشعار مهمة جديدة أو محدثة",
+                recipients=recipients[i:i + batch_size],
+                subject="📌 تذكير: مهمة مستحقة قريباً",
                 message=message,
-                reference_doctype=doc.doctype,
-                reference_name=doc.name
+                reference_doctype="Service Task",
+                reference_name=task.name
             )
 
-            # إشعار داخل النظام 🔔
-            frappe.get_doc({
-                "doctype": "Notification Log",
-                "subject": f"📋 مهمة: {doc.task_title}",
+        for user in recipients:
+            logs.append({
+                "subject": f"📌 تذكير: {task.task_title}",
                 "email_content": message,
                 "for_user": user,
-                "document_type": doc.doctype,
-                "document_name": doc.name,
-                "type": "Alert"
-            }).insert(ignore_permissions=True)
+                "document_type": "Service Task",
+                "document_name": task.name
+            })
 
+    # إشعار داخل النظام 🔔
+    bulk_insert_notification_logs(logs)
 
-def notify_scheduled_tasks():
-    """تشغيل يومي لإرسال تذكير بالتاسكات المستحقة"""
-    today = nowdate()
+    # إشعار فوري على قناة كل مستخدم يرى المهام
+    publish_task_deltas(tasks, TASK_DELTA_REMINDER)
+
+
+def get_digest_hour():
+    return cint(frappe.conf.get("service_planner_digest_hour", DEFAULT_DIGEST_HOUR))
+
+
+def is_digest_due(user, now_utc):
+    """
+    هل حان ملخص اليوم لهذا المستخدم؟ (مرة واحدة لكل يوم محلي)
+
+    Returns the user's local date when the digest is due, else None.
+    """
+    local_now = tz_manager.convert_to_local(now_utc, tz_manager.get_user_timezone(user))
+    if local_now.hour < get_digest_hour():
+        return None
+
+    local_date = local_now.date().isoformat()
+    last_sent = frappe.defaults.get_user_default(LAST_DIGEST_DEFAULT, user)
+    if last_sent and str(last_sent) >= local_date:
+        return None
+    return local_date
+
+
+def get_next_digest_time(user, now_utc):
+    """موعد الملخص التالي للمستخدم بتوقيت UTC"""
+    user_tz = tz_manager.get_user_timezone(user)
+    local_now = tz_manager.convert_to_local(now_utc, user_tz).replace(tzinfo=None)
+    next_digest = datetime.combine(local_now.date(), time(get_digest_hour()))
+    if next_digest <= local_now:
+        next_digest += timedelta(days=1)
+    return tz_manager.convert_to_utc(next_digest, user_tz).replace(tzinfo=None)
+
+
+def get_catch_up_tasks(user, tasks, now_utc):
+    """
+    مهام أنشئت أو عُدلت بعد آخر ما أُرسل للمستخدم وموعدها قبل ملخصه التالي
+
+    Such a task was not in the last digest and is due before the next one, and
+    digest users get no per-task reminder, so it is sent in a catch-up message.
+    """
+    next_digest = get_next_digest_time(user, now_utc)
+    covered_until = frappe.defaults.get_user_default(DIGEST_COVERED_UNTIL_DEFAULT, user)
+    covered_until = get_datetime(covered_until) if covered_until else None
+    return [
+        task for task in tasks
+        if get_datetime(task.due_date) < next_digest
+        and (not covered_until or get_datetime(task.modified) > covered_until)
+    ]
+
+
+def get_digest_window(now_utc):
+    """مواعيد الاستحقاق (UTC) التي يقرأها send_daily_digests: الملخص والمهام قبل الملخص التالي"""
+    return now_utc, now_utc + max(get_reminder_lead(), timedelta(days=1))
+
+
+def send_daily_digests(now_utc):
+    """
+    ملخص يومي واحد لكل مستخدم بنمط "Daily Digest"
+
+    Holds every task the user can see that is due within the reminder lead time.
+    Digests are a day apart, so with the default 24h lead each task appears in a
+    digest before it is due. The date is stored before sending, like the claims
+    of per-task reminders, so a rerun never sends a second digest the same day.
+
+    Between digests, tasks created or rescheduled after the user's last message
+    and due before the next digest are sent by the next hourly run as a short
+    catch-up message, once per change.
+    """
     tasks = frappe.get_all(
         "Service Task",
-        filters={"due_date": today},
-        fields=["name", "task_title", "assigned_role", "assigned_to", "due_date"]
+        filters=get_due_task_filters(*get_digest_window(now_utc)),
+        fields=[*REMINDER_TASK_FIELDS, "modified"]
     )
+    if not tasks:
+        return
 
+    recipients_by_task = resolve_task_recipients(tasks)
+    digest_users = get_digest_users(set().union(*recipients_by_task.values()))
+    if not digest_users:
+        return
+
+    tasks_by_user = {}
     for task in tasks:
-        recipients = set()
-
-        # حسب الدور
-        if task.assigned_role:
-            users_with_role = frappe.get_all(
-                "Has Role",
-                filters={"role": task.assigned_role},
-                fields=["parent"]
-            )
-            for user in users_with_role:
-                recipients.add(user.parent)
-
-        # حسب المستخدم المخصص
-        if task.assigned_to:
-            recipients.add(task.assigned_to)
-
-        recipients = [u for u in recipients if u not in ("Guest", "Administrator")]
-
-        if recipients:
-            message = f"""
-                🕒 <b>تذكير بمهمة اليوم:</b><br>
-                <b>المهمة:</b> {task.task_title}<br>
-                <b>التاريخ:</b> {task.due_date}
-            """
-            for user in recipients:
-                frappe.publish_realtime(
-                    event="task_notification",
-                    user=user,
-                    message=message
-                )
-
-                frappe.sendmail(
-                    recipients=user,
-                    subject="📌 تذكير: مهمة مستحقة اليوم",
-                    message=message,
-                    reference_doctype="Service Task",
-                    reference_name=task.name
-                )
-
-                frappe.get_doc({
-                    "doctype": "Notification Log",
-                    "subject": f"📌 تذكير: {task.task_title}",
-                    "email_content": message,
-                    "for_user": user,
-                    "document_type": "Service Task",
-                    "document_name": task.name,
-                    "type": "Alert"
-                }).insert(ignore_permissions=True)
+        for user in recipients_by_task.get(task.name, ()):
+            if user in digest_users:
+                tasks_by_user.setdefault(user, []).append(task)
+
+    digest_end = now_utc + get_reminder_lead()
+    digest_tasks = {}
+    catch_up_tasks = {}
+    for user, user_tasks in tasks_by_user.items():
+        local_date = is_digest_due(user, now_utc)
+        if local_date:
+            due_tasks = [task for task in user_tasks if get_datetime(task.due_date) < digest_end]
+            if due_tasks:
+                digest_tasks[user] = (local_date, due_tasks)
+        else:
+            changed_tasks = get_catch_up_tasks(user, user_tasks, now_utc)
+            if changed_tasks:
+                catch_up_tasks[user] = changed_tasks
+    if not digest_tasks and not catch_up_tasks:
+        return
+
+    covered_until = str(now_datetime())
+    for user, (local_date, _user_tasks) in digest_tasks.items():
+        frappe.defaults.set_user_default(LAST_DIGEST_DEFAULT, local_date, user)
+    for user in [*digest_tasks, *catch_up_tasks]:
+        frappe.defaults.set_user_default(DIGEST_COVERED_UNTIL_DEFAULT, covered_until, user)
+    frappe.db.commit()
+
+    messages = [
+        (user, f"📌 تذكير: {len(user_tasks)} مهام مستحقة قريباً", user_tasks)
+        for user, (_local_date, user_tasks) in digest_tasks.items()
+    ]
+    messages.extend(
+        (user, f"📌 تذكير: {len(user_tasks)} مهام جديدة مستحقة قبل الملخص التالي", user_tasks)
+        for user, user_tasks in catch_up_tasks.items()
+    )
+
+    logs = []
+    for user, subject, user_tasks in messages:
+        message = build_digest_message(user, user_tasks)
+        frappe.sendmail(
+            recipients=[user],
+            subject=subject,
+            message=message
+        )
+        logs.append({
+            "subject": subject,
+            "email_content": message,
+            "for_user": user,
+            "document_type": None,
+            "document_name": None
+        })
+
+    bulk_insert_notification_logs(logs)
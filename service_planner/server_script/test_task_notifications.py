@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now_datetime
+
+from service_planner.server_script.task_notifications import REMINDER_CLAIM_HOURS, claim_tasks
+
+TEST_PROJECT = "_Test Claim Project"
+
+
+class TestClaimTasks(FrappeTestCase):
+    def setUp(self):
+        # claim_tasks commits, so the rows are removed explicitly in tearDown
+        self.task_names = []
+        for idx in range(3):
+            task = frappe.get_doc({
+                "doctype": "Service Task",
+                "parent": TEST_PROJECT,
+                "parenttype": "Service Project",
+                "parentfield": "service_tasks",
+                "idx": idx + 1,
+                "task_title": f"Claim test {idx}",
+                "due_date": now_datetime() + timedelta(hours=24),
+                "assigned_role": "System Manager",
+                "status": "Pending",
+            })
+            task.db_insert()
+            self.task_names.append(task.name)
+        frappe.db.commit()
+
+    def tearDown(self):
+        frappe.db.delete("Service Task", {"parent": TEST_PROJECT})
+        frappe.db.commit()
+
+    def test_second_claim_returns_nothing(self):
+        since = now_datetime() - timedelta(hours=REMINDER_CLAIM_HOURS)
+
+        self.assertEqual(sorted(claim_tasks(self.task_names, since)), sorted(self.task_names))
+        self.assertEqual(claim_tasks(self.task_names, since), [])
+
+    def test_claim_skips_tasks_claimed_by_another_run(self):
+        since = now_datetime() - timedelta(hours=REMINDER_CLAIM_HOURS)
+
+        self.assertEqual(claim_tasks(self.task_names[:1], since), self.task_names[:1])
+        self.assertEqual(sorted(claim_tasks(self.task_names, since)), sorted(self.task_names[1:]))
+
+    def test_claim_expires_after_the_claim_window(self):
+        since = now_datetime() - timedelta(hours=REMINDER_CLAIM_HOURS)
+        claim_tasks(self.task_names, since)
+
+        # A later run whose window starts after these claims may claim the tasks again
+        self.assertEqual(
+            sorted(claim_tasks(self.task_names, now_datetime() + timedelta(seconds=1))),
+            sorted(self.task_names)
+        )
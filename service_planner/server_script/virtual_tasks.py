@@ -0,0 +1,229 @@
+import frappe
+from collections import Counter
+from datetime import timedelta
+from frappe import _
+from frappe.utils import getdate
+
+from service_planner.server_script.auto_generate_tasks import (
+    CLOSED_PROJECT_STATUSES, build_task_rows, get_task_date_key, get_task_dates
+)
+from service_planner.utils.recurrence import RecurrenceRule
+from service_planner.utils.task_stats import invalidate_task_stats
+
+# Occurrences past a project's materialized horizon are served without a row.
+# Their name encodes the project and the local date: "virtual:<project>:<YYYY-MM-DD>"
+VIRTUAL_TASK_PREFIX = "virtual:"
+
+# Upper bound used by read APIs when the caller does not ask for a date window
+DEFAULT_VIRTUAL_WINDOW_DAYS = 90
+
+PROJECT_SCHEDULE_FIELDS = [
+    "name", "owner", "docstatus", "project_name", "organization", "schedule_type",
+    "start_date", "end_date", "interval_days", "task_time", "duration_hours",
+    "default_role", "task_template", "materialized_until"
+]
+
+def is_virtual_task(name):
+    return bool(name) and str(name).startswith(VIRTUAL_TASK_PREFIX)
+
+def make_virtual_task_name(project, task_date):
+    return f"{VIRTUAL_TASK_PREFIX}{project}:{task_date.strftime('%Y-%m-%d')}"
+
+def parse_virtual_task_name(name):
+    """Return (project, date) for a virtual task name, or None if it is not one."""
+    if not is_virtual_task(name):
+        return None
+
+    project, _sep, date_str = name[len(VIRTUAL_TASK_PREFIX):].rpartition(":")
+    if not project:
+        return None
+
+    try:
+        return project, getdate(date_str)
+    except Exception:
+        return None
+
+def get_schedule_projects(filters):
+    """Load only the schedule fields (and weekdays) of the matching projects."""
+    projects = frappe.get_all("Service Project", filters=filters, fields=PROJECT_SCHEDULE_FIELDS)
+    if not projects:
+        return []
+
+    weekly_days = {}
+    for row in frappe.get_all(
+        "Week Day",
+        filters={
+            "parenttype": "Service Project",
+            "parentfield": "weekly_days",
+            "parent": ["in", [p.name for p in projects]]
+        },
+        fields=["parent", "day"],
+        order_by="idx asc"
+    ):
+        weekly_days.setdefault(row.parent, []).append(frappe._dict(day=row.day))
+
+    for project in projects:
+        project.weekly_days = weekly_days.get(project.name, [])
+
+    return projects
+
+def _get_virtual_window_start(project, from_date):
+    """Virtual occurrences only exist after the materialized horizon."""
+    if project.materialized_until:
+        return max(from_date, getdate(project.materialized_until) + timedelta(days=1))
+    return from_date
+
+def _get_materialized_keys(project_names, from_date, to_date):
+    """(project, local date) pairs that already have a real row inside the window."""
+    if not project_names:
+        return set()
+
+    rows = frappe.get_all(
+        "Service Task",
+        filters={
+            "parenttype": "Service Project",
+            "parent": ["in", project_names],
+            "local_due_date": ["between", [from_date, to_date + timedelta(days=1)]]
+        },
+        fields=["parent", "local_due_date", "due_date"]
+    )
+    return {(row.parent, get_task_date_key(row)) for row in rows}
+
+def build_virtual_tasks(project, task_dates):
+    """Expand occurrences into task dicts shaped like `tabService Task` rows."""
+    tasks = []
+    for key, row in build_task_rows(project, task_dates).items():
+        row.update({
+            "name": make_virtual_task_name(project.name, getdate(key)),
+            "parent": project.name,
+            "parenttype": "Service Project",
+            "parentfield": "service_tasks",
+            "assigned_to": None,
+            "creation": None,
+            "modified": None,
+            "is_virtual": 1,
+        })
+        tasks.append(frappe._dict(row))
+    return tasks
+
+def get_virtual_tasks(from_date, to_date, roles=None, limit=None):
+    """
+    Expand the unmaterialized occurrences of every open project in [from_date, to_date].
+
+    `roles` restricts the result to projects whose default role is in the list
+    (pass None for no restriction, e.g. for administrators). `limit` caps the
+    occurrences expanded per project, for callers that only need the first ones
+    (e.g. one page ordered by due date).
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    if to_date < from_date:
+        return []
+
+    filters = {"docstatus": ["<", 2], "status": ["not in", CLOSED_PROJECT_STATUSES]}
+    if roles is not None:
+        if not roles:
+            return []
+        filters["default_role"] = ["in", list(roles)]
+
+    windows = []
+    for project in get_schedule_projects(filters):
+        start = _get_virtual_window_start(project, from_date)
+        if start > to_date or (project.end_date and getdate(project.end_date) < start):
+            continue
+        windows.append((project, start))
+
+    materialized = _get_materialized_keys([p.name for p, _start in windows], from_date, to_date)
+    materialized_per_project = Counter(project_name for project_name, _key in materialized)
+
+    tasks = []
+    for project, start in windows:
+        # Materialized dates are skipped below, so ask for that many more
+        project_limit = limit + materialized_per_project[project.name] if limit else None
+        task_dates = [
+            task_date
+            for task_date in RecurrenceRule.from_doc(project).dates_between(start, to_date, limit=project_limit)
+            if (project.name, task_date.strftime('%Y-%m-%d')) not in materialized
+        ][:limit]
+        if task_dates:
+            tasks.extend(build_virtual_tasks(project, task_dates))
+
+    return tasks
+
+def get_virtual_task(name):
+    """Return the virtual task behind `name`, or None if it does not (or no longer) exist."""
+    parsed = parse_virtual_task_name(name)
+    if not parsed:
+        return None
+
+    project_name, task_date = parsed
+    projects = get_schedule_projects({"name": project_name, "docstatus": ["<", 2]})
+    if not projects:
+        return None
+
+    project = projects[0]
+    if _get_virtual_window_start(project, task_date) != task_date:
+        return None
+    if task_date not in get_task_dates(project, task_date, task_date):
+        return None
+    materialized = _get_materialized_keys([project_name], task_date, task_date)
+    if (project_name, task_date.strftime('%Y-%m-%d')) in materialized:
+        return None
+
+    return build_virtual_tasks(project, [task_date])[0]
+
+def materialize_virtual_task(name):
+    """
+    Create the real Service Task row for a virtual occurrence and return its name.
+
+    Called when someone assigns, edits or changes the status of the occurrence.
+    If the row already exists (e.g. a concurrent request created it) that row is returned.
+    Only the schedule fields of the project are read; its task rows are not loaded.
+    """
+    parsed = parse_virtual_task_name(name)
+    if not parsed:
+        frappe.throw(_("Task does not exist"), frappe.DoesNotExistError)
+
+    project_name, task_date = parsed
+    # Serialize materialization per project so the same occurrence is never created twice
+    frappe.db.get_value("Service Project", project_name, "name", for_update=True)
+
+    existing = frappe.db.exists("Service Task", {
+        "parenttype": "Service Project",
+        "parent": project_name,
+        "auto_generated": 1,
+        "local_due_date": ["between", [task_date, task_date]],
+    })
+    if existing:
+        return existing
+
+    projects = get_schedule_projects({"name": project_name, "docstatus": ["<", 2]})
+    if not projects:
+        frappe.throw(_("Task does not exist"), frappe.DoesNotExistError)
+
+    project = projects[0]
+    # Dates up to materialized_until are real rows; a missing one was deleted on purpose
+    if _get_virtual_window_start(project, task_date) != task_date:
+        frappe.throw(_("Task does not exist"), frappe.DoesNotExistError)
+    if task_date not in get_task_dates(project, task_date, task_date):
+        frappe.throw(_("Task does not exist"), frappe.DoesNotExistError)
+
+    key = task_date.strftime('%Y-%m-%d')
+    idx = frappe.db.sql(
+        """SELECT IFNULL(MAX(idx), 0) FROM `tabService Task`
+        WHERE parent = %s AND parenttype = 'Service Project' AND parentfield = 'service_tasks'""",
+        project_name
+    )[0][0]
+
+    task = frappe.get_doc({
+        "doctype": "Service Task",
+        "parent": project_name,
+        "parenttype": "Service Project",
+        "parentfield": "service_tasks",
+        "idx": idx + 1,
+        **build_task_rows(project, [task_date])[key],
+    })
+    task.docstatus = project.docstatus
+    task.db_insert()
+    invalidate_task_stats([task])
+
+    return task.name
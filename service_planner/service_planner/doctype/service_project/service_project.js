@@ -9,6 +9,53 @@
 
 
 frappe.ui.form.on('Service Project', {
+    setup: function(frm) {
+        // إعادة تحميل النموذج عند انتهاء توليد المهام في الخلفية
+        frappe.realtime.on('service_project_tasks_regenerated', (data) => {
+            if (!data || data.project !== frm.doc.name) return;
+
+            frappe.show_alert({
+                message: data.status === 'Complete'
+                    ? __('Tasks regenerated successfully')
+                    : __('Task regeneration failed. Please check system logs for details.'),
+                indicator: data.status === 'Complete' ? 'green' : 'red'
+            });
+            frm.reload_doc();
+        });
+    },
+
+    refresh: function(frm) {
+        if (frm.doc.regeneration_status === 'Pending') {
+            frm.dashboard.set_headline_alert(
+                __('Tasks are being regenerated in the background...'), 'blue'
+            );
+        }
+
+        // تغيير تاريخ الانتهاء دون حفظ كل صفوف المهام
+        if (!frm.is_new() && frm.doc.docstatus < 2) {
+            frm.add_custom_button(__('Change End Date'), function() {
+                frappe.prompt({
+                    fieldname: 'end_date',
+                    fieldtype: 'Date',
+                    label: __('End Date'),
+                    default: frm.doc.end_date
+                }, function(values) {
+                    frappe.call({
+                        method: 'service_planner.server_script.auto_generate_tasks.update_project_end_date',
+                        args: { project_name: frm.doc.name, end_date: values.end_date || null },
+                        freeze: true,
+                        callback: function(r) {
+                            if (r.message) {
+                                frappe.show_alert({ message: r.message.message, indicator: 'green' });
+                            }
+                            frm.reload_doc();
+                        }
+                    });
+                }, __('Change End Date'), __('Update'));
+            });
+        }
+    },
+
     schedule_type: function(frm) {
         // إعادة تقييم الحقول الإلزامية عند تغيير نوع الجدولة
         frm.refresh_field('weekly_days');
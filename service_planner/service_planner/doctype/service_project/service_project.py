@@ -1,25 +1,13 @@
 import frappe
 from frappe.model.document import Document
-from service_planner.scripts.generate_tasks import generate_task_title  # ← تأكد من المسار الصحيح
+from service_planner.utils.task_search import get_notes_text
 
 class ServiceProject(Document):
     def before_save(self):
         for task in self.service_tasks:
             if not task.organization:
                 task.organization = self.organization
-
-        self.update_task_titles()  # ← استدعاء الدالة هنا مهم
-
-    def update_task_titles(self):
-        """تحديث العناوين تلقائيًا عند تغيير الـ Task Template"""
-        if not self.get_doc_before_save():
-            return
-
-        old = self.get_doc_before_save()
-        if self.task_template != old.task_template:
-            for task in self.service_tasks:
-                if task.due_date:
-                    task.task_title = generate_task_title(self, task.due_date)
+            task.notes_text = get_notes_text(task.notes)
 
 # فلترة المشاريع بحيث المستخدم يرى فقط المشاريع التي تنتمي لشركته
 def permission_query_condition(user):
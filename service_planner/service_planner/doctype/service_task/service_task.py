@@ -1,6 +1,9 @@
 import frappe
 from frappe.model.document import Document
+from service_planner.utils.role_index import get_user_info, get_user_roles
+from service_planner.utils.task_search import add_task_search_index, get_notes_text
 from service_planner.utils.timezone_utils import tz_manager
+from collections import defaultdict
 from datetime import datetime
 import pytz
 
@@ -9,21 +12,17 @@ class ServiceTask(Document):
         """التحقق والتحديث التلقائي"""
         if not self.user_timezone:
             # الحصول على المنطقة الزمنية من المستخدم المسؤول عن المهمة
-            if self.assigned_to:
-                user_tz = frappe.db.get_value("User", self.assigned_to, "time_zone")
-            else:
+            user = self.assigned_to
+            if not user and self.parenttype and self.parent:
                 # إذا لم يكن هناك مستخدم محدد، استخدم منطقة صاحب المشروع
-                project = frappe.get_doc(self.parenttype, self.parent)
-                user_tz = frappe.db.get_value("User", project.owner, "time_zone")
-            
-            # إذا لم يتم العثور على منطقة زمنية، استخدم منطقة المستخدم الحالي
-            if not user_tz:
-                user_tz = frappe.db.get_value("User", frappe.session.user, "time_zone")
-                
-            # إذا لم يتم العثور على أي منطقة زمنية، استخدم منطقة النظام
+                user = frappe.db.get_value(self.parenttype, self.parent, "owner")
+
+            user_tz = tz_manager.get_user_timezone_name(user, default="") if user else ""
+
+            # إذا لم يتم العثور على منطقة زمنية، استخدم منطقة المستخدم الحالي ثم منطقة النظام
             if not user_tz:
-                user_tz = frappe.db.get_single_value("System Settings", "time_zone") or "UTC"
-                
+                user_tz = tz_manager.get_user_timezone_name(frappe.session.user)
+
             self.user_timezone = user_tz
             
         if not self.due_date_utc and self.due_date:
@@ -42,6 +41,9 @@ class ServiceTask(Document):
                 # في حالة الخطأ، استخدم التاريخ الأصلي
                 self.local_due_date = self.due_date
         
+        # نص الملاحظات بدون HTML لفهرس البحث
+        self.notes_text = get_notes_text(self.notes)
+
         # استدعاء الvalidations الأخرى
         self.validate_assignments()
         
@@ -49,7 +51,7 @@ class ServiceTask(Document):
         """التحقق من صحة التعيينات"""
         if self.assigned_to:
             # التحقق من أن المستخدم المعين له الدور المطلوب
-            user_roles = frappe.get_roles(self.assigned_to)
+            user_roles = get_user_roles(self.assigned_to)
             if self.assigned_role not in user_roles:
                 frappe.throw(
                     f"User {self.assigned_to} does not have the required role: {self.assigned_role}"
@@ -57,46 +59,7 @@ class ServiceTask(Document):
                 
     def handle_timezone(self):
         """معالجة محسّنة للمناطق الزمنية - بدون DST يدوي"""
-        if not self.due_date:
-            return
-            
-        try:
-            # 1. تحديد المنطقة الزمنية
-            if self.assigned_to:
-                user_tz = tz_manager.get_user_timezone(self.assigned_to)
-            else:
-                user_tz = tz_manager.get_user_timezone()
-            
-            # 2. حفظ المنطقة الزمنية فقط (بدون الحقول الزائدة)
-            self.user_timezone = str(user_tz)
-            
-            # 3. معالجة التحويل حسب مصدر البيانات
-            if hasattr(self, 'flags') and self.flags.get('due_date_is_utc'):
-                # البيانات مُدخلة من generate_service_tasks - already UTC
-                self.due_date_utc = self.due_date
-            else:
-                # البيانات مُدخلة من المستخدم - بحاجة لتحويل
-                local_dt = frappe.utils.get_datetime(self.due_date)
-                
-                # تحويل إلى aware datetime
-                if not local_dt.tzinfo:
-                    local_aware_dt = user_tz.localize(local_dt)
-                else:
-                    local_aware_dt = local_dt
-                
-                # تحويل إلى UTC (pytz يعالج DST تلقائياً!)
-                utc_dt = local_aware_dt.astimezone(pytz.utc)
-                
-                # حفظ النسختين
-                self.due_date = utc_dt.replace(tzinfo=None)  # UTC للتخزين
-                self.due_date_utc = self.due_date  # نفس القيمة
-                self.local_due_date = local_aware_dt.replace(tzinfo=None)  # المحلي للعرض
-            
-            # 4. حساب وحفظ معلومات إضافية للعرض
-            self.update_timezone_info()
-            
-        except Exception as e:
-            frappe.log_error(f"Timezone conversion error: {str(e)}")
+        handle_timezones([self])
     
     def update_timezone_info(self):
         """تحديث معلومات المنطقة الزمنية للعرض"""
@@ -170,9 +133,8 @@ class ServiceTask(Document):
             return str(self.due_date)
 
     def on_update(self):
-        """معالجة التحديثات"""
+        """معالجة التحديثات (أحداث الإشعارات يسجلها notification_outbox.record_task_event)"""
         self.update_timing_fields()
-        self.notify_assignment_changes()
         
     def update_timing_fields(self):
         """تحديث حقول التوقيت"""
@@ -182,32 +144,6 @@ class ServiceTask(Document):
             self.completion_time = now
         elif self.status == "In Progress" and not self.start_time:
             self.start_time = now
-            
-    def notify_assignment_changes(self):
-        """إرسال إشعارات عند تغيير التعيينات"""
-        if self.has_value_changed('assigned_to') and self.assigned_to:
-            self.notify_assignment()
-            
-    def notify_assignment(self):
-        """إرسال إشعار للمستخدم المعين"""
-        try:
-            due_date_local = self.get_formatted_due_date(self.assigned_to)
-            
-            frappe.sendmail(
-                recipients=[self.assigned_to],
-                subject=f"New Task Assignment: {self.task_title}",
-                message=f"""
-                You have been assigned a new task:
-                
-                Task: {self.task_title}
-                Due Date: {due_date_local}
-                Priority: {self.priority or 'Normal'}
-                
-                Please review the task details and update the status accordingly.
-                """
-            )
-        except Exception as e:
-            frappe.log_error(f"Task notification error: {str(e)}")
     
     def before_save(self):
         """قبل الحفظ - تحديث معلومات العرض"""
@@ -215,16 +151,100 @@ class ServiceTask(Document):
             # احفظ HTML في due_date_display
             self.due_date_display = self._timezone_info_html
 
+def handle_timezones(tasks):
+    """
+    معالجة المناطق الزمنية لمجموعة مهام: تجميعها حسب المنطقة وتحويل كل مجموعة دفعة واحدة
+
+    Tasks flagged `due_date_is_utc` (from generate_service_tasks) already hold
+    UTC; the others hold a local time entered by the user and are converted.
+    """
+    tasks_by_timezone = defaultdict(list)
+    for task in tasks:
+        if not task.due_date:
+            continue
+        try:
+            # 1. تحديد المنطقة الزمنية
+            user_tz_str = str(tz_manager.get_user_timezone(task.assigned_to or None))
+            tasks_by_timezone[user_tz_str].append(task)
+        except Exception as e:
+            frappe.log_error(f"Timezone conversion error: {str(e)}")
+
+    for user_tz_str, tz_tasks in tasks_by_timezone.items():
+        try:
+            local_tasks = []
+            for task in tz_tasks:
+                # 2. حفظ المنطقة الزمنية فقط (بدون الحقول الزائدة)
+                task.user_timezone = user_tz_str
+                if task.flags.get('due_date_is_utc'):
+                    # البيانات مُدخلة من generate_service_tasks - already UTC
+                    task.due_date_utc = task.due_date
+                else:
+                    local_tasks.append(task)
+
+            # 3. البيانات مُدخلة من المستخدم - تحويل المجموعة دفعة واحدة (DST من جدول الانتقالات)
+            local_dts = [frappe.utils.get_datetime(task.due_date) for task in local_tasks]
+            naive_dts = [dt for dt in local_dts if not dt.tzinfo]
+            localized = iter(tz_manager.localize_many(user_tz_str, naive_dts))
+
+            for task, local_dt in zip(local_tasks, local_dts, strict=True):
+                local_aware_dt = local_dt if local_dt.tzinfo else next(localized)
+                utc_dt = local_aware_dt.astimezone(pytz.utc)
+
+                # حفظ النسختين
+                task.due_date = utc_dt.replace(tzinfo=None)  # UTC للتخزين
+                task.due_date_utc = task.due_date  # نفس القيمة
+                task.local_due_date = local_aware_dt.replace(tzinfo=None)  # المحلي للعرض
+
+            # 4. حساب وحفظ معلومات إضافية للعرض
+            for task in tz_tasks:
+                task.update_timezone_info()
+
+        except Exception as e:
+            frappe.log_error(f"Timezone conversion error: {str(e)}")
+
+def set_missing_local_due_dates(tasks):
+    """ملء user_timezone و local_due_date الناقصة، مع تحويل كل منطقة زمنية دفعة واحدة (due_date هو UTC)"""
+    tasks_by_timezone = defaultdict(list)
+    for task in tasks:
+        if task.due_date and not (task.user_timezone and task.local_due_date):
+            user_tz_str = task.user_timezone or str(tz_manager.get_user_timezone(task.assigned_to or None))
+            tasks_by_timezone[user_tz_str].append(task)
+
+    for user_tz_str, tz_tasks in tasks_by_timezone.items():
+        local_dts = tz_manager.convert_many_to_local(
+            user_tz_str, [frappe.utils.get_datetime(task.due_date) for task in tz_tasks]
+        )
+        for task, local_dt in zip(tz_tasks, local_dts, strict=True):
+            task.user_timezone = user_tz_str
+            if not task.local_due_date:
+                task.local_due_date = local_dt.replace(tzinfo=None)
+
+# فهارس مركبة تطابق أشكال الاستعلامات في task_api والإشعارات
+SERVICE_TASK_INDEXES = {
+    "assigned_to_status_due_date_index": ("assigned_to", "status", "due_date"),
+    "assigned_role_assigned_to_due_date_index": ("assigned_role", "assigned_to", "due_date"),
+    "parent_due_date_index": ("parent", "due_date"),
+}
+
+def add_service_task_indexes():
+    """إنشاء الفهارس الناقصة فقط (add_index يتجاهل الفهرس الموجود)"""
+    for index_name, fields in SERVICE_TASK_INDEXES.items():
+        frappe.db.add_index("Service Task", list(fields), index_name)
+    add_task_search_index()
+
+def on_doctype_update():
+    add_service_task_indexes()
+
 # توابع الصلاحيات
 def get_permission_query_conditions(user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user):
+    user_roles = get_user_roles(user)
+    if "System Manager" in user_roles:
         return ""
 
-    user_roles = frappe.get_roles(user)
-    user_org = frappe.get_cached_value("User", user, "organization")
+    user_org = get_user_info(user).organization
 
     if not user_org or not user_roles:
         return "1=0"
@@ -238,11 +258,11 @@ def get_permission_query_conditions(user):
     """
 
 def has_permission(doc, ptype, user):
-    if "System Manager" in frappe.get_roles(user):
+    user_roles = get_user_roles(user)
+    if "System Manager" in user_roles:
         return True
 
-    user_roles = frappe.get_roles(user)
-    user_org = frappe.get_cached_value("User", user, "organization")
+    user_org = get_user_info(user).organization
     
     is_assigned = (
         doc.assigned_to == user or 
@@ -376,27 +396,31 @@ def bulk_fix_timezones(project_name=None):
         fixed_count = 0
         errors = []
         
+        # تجميع المهام حسب المشروع: تحميل وحفظ كل مشروع مرة واحدة
+        tasks_by_parent = defaultdict(set)
         for task_data in tasks:
+            tasks_by_parent[(task_data['parenttype'], task_data['parent'])].add(task_data['name'])
+        
+        for (parenttype, parent), task_names in tasks_by_parent.items():
             try:
                 # Load the parent document
-                parent_doc = frappe.get_doc(task_data['parenttype'], task_data['parent'])
+                parent_doc = frappe.get_doc(parenttype, parent)
                 
-                # Find and fix the specific task
-                for task in parent_doc.service_tasks:
-                    if task.name == task_data['name']:
-                        # Set flag to indicate UTC
-                        task.flags.due_date_is_utc = True
-                        task.handle_timezone()
-                        fixed_count += 1
-                        break
+                # Find and fix the selected tasks
+                rows = [task for task in parent_doc.service_tasks if task.name in task_names]
+                for task in rows:
+                    # Set flag to indicate UTC
+                    task.flags.due_date_is_utc = True
+                handle_timezones(rows)
                 
                 parent_doc.save()
+                fixed_count += len(rows)
                 
             except Exception as e:
-                errors.append({
-                    "task": task_data['name'],
+                errors.extend({
+                    "task": task_name,
                     "error": str(e)
-                })
+                } for task_name in task_names)
         
         return {
             "success": True,
@@ -488,8 +512,12 @@ def verify_timezone_system():
 def migrate_old_tasks():
     """تحديث المهام القديمة للنظام الجديد"""
     
-    # جلب كل المشاريع
-    projects = frappe.get_all("Service Project", pluck="name")
+    # المشاريع التي لديها مهام بدون due_date_utc فقط
+    projects = frappe.get_all("Service Task",
+        filters={"parenttype": "Service Project", "due_date": ["is", "set"], "due_date_utc": ["is", "not set"]},
+        pluck="parent",
+        distinct=True
+    )
     
     fixed = 0
     errors = []
@@ -497,18 +525,19 @@ def migrate_old_tasks():
     for project_name in projects:
         try:
             doc = frappe.get_doc("Service Project", project_name)
-            modified = False
             
-            for task in doc.service_tasks:
-                # إذا لم يكن عندها due_date_utc
-                if task.due_date and not task.due_date_utc:
-                    task.due_date_utc = task.due_date
-                    task.flags.due_date_is_utc = True
-                    fixed += 1
-                    modified = True
+            # إذا لم يكن عندها due_date_utc
+            rows = [task for task in doc.service_tasks if task.due_date and not task.due_date_utc]
+            for task in rows:
+                task.due_date_utc = task.due_date
+                task.flags.due_date_is_utc = True
+            
+            # المنطقة الزمنية والتاريخ المحلي الناقص دفعة واحدة لكل منطقة (بدل التحويل لكل صف في validate)
+            set_missing_local_due_dates(rows)
             
-            if modified:
+            if rows:
                 doc.save()
+                fixed += len(rows)
                 
         except Exception as e:
             errors.append(f"{project_name}: {str(e)}")
@@ -705,7 +734,7 @@ def detailed_system_check():
 def fix_remaining_issues():
     """إصلاح المشاكل المتبقية"""
     from service_planner.utils.timezone_utils import tz_manager
-    import pytz
+    from collections import defaultdict
     
     fixed = {
         "missing_utc": 0,
@@ -733,43 +762,52 @@ def fix_remaining_issues():
     
     # إصلاح المهام بدون timezone و local_due_date
     tasks = frappe.db.sql("""
-        SELECT name, parent, parenttype, due_date
-        FROM `tabService Task`
-        WHERE (user_timezone IS NULL OR user_timezone = ''
-        OR local_due_date IS NULL OR local_due_date = '')
-        AND due_date IS NOT NULL
+        SELECT t.name, t.due_date, t.user_timezone, t.local_due_date,
+            p.owner AS project_owner
+        FROM `tabService Task` t
+        LEFT JOIN `tabService Project` p ON p.name = t.parent
+        WHERE (t.user_timezone IS NULL OR t.user_timezone = ''
+        OR t.local_due_date IS NULL OR t.local_due_date = '')
+        AND t.due_date IS NOT NULL
     """, as_dict=True)
     
+    # تجميع المهام حسب المنطقة الزمنية لتحويلها دفعة واحدة
+    tasks_by_timezone = defaultdict(list)
     for task in tasks:
         try:
-            # احصل على timezone من المشروع
-            project = frappe.get_doc(task.parenttype, task.parent)
-            user_tz_str = tz_manager.get_user_timezone(project.owner)
-            user_tz = pytz.timezone(user_tz_str)
-            
-            updates = {}
-            
-            # أضف timezone إذا مفقود
-            if not frappe.db.get_value("Service Task", task.name, "user_timezone"):
-                updates["user_timezone"] = str(user_tz_str)
-                fixed["missing_timezone"] += 1
-            
-            # أضف local_due_date إذا مفقود
-            if not frappe.db.get_value("Service Task", task.name, "local_due_date"):
-                # افترض أن due_date هو UTC
-                utc_dt = pytz.utc.localize(frappe.utils.get_datetime(task.due_date))
-                local_dt = utc_dt.astimezone(user_tz)
-                updates["local_due_date"] = local_dt.replace(tzinfo=None)
-                fixed["missing_local_date"] += 1
-            
-            # حدث البيانات
-            if updates:
-                for field, value in updates.items():
-                    frappe.db.set_value("Service Task", task.name, field, value, update_modified=False)
-                    
+            # احصل على timezone من صاحب المشروع
+            user_tz_str = str(tz_manager.get_user_timezone(task.project_owner))
+            tasks_by_timezone[user_tz_str].append(task)
         except Exception as e:
             frappe.log_error(f"Error fixing task {task.name}: {str(e)}")
     
+    for user_tz_str, tz_tasks in tasks_by_timezone.items():
+        # افترض أن due_date هو UTC
+        local_dts = tz_manager.convert_many_to_local(
+            user_tz_str, [frappe.utils.get_datetime(task.due_date) for task in tz_tasks]
+        )
+        
+        for task, local_dt in zip(tz_tasks, local_dts, strict=True):
+            try:
+                updates = {}
+                
+                # أضف timezone إذا مفقود
+                if not task.user_timezone:
+                    updates["user_timezone"] = user_tz_str
+                    fixed["missing_timezone"] += 1
+                
+                # أضف local_due_date إذا مفقود
+                if not task.local_due_date:
+                    updates["local_due_date"] = local_dt.replace(tzinfo=None)
+                    fixed["missing_local_date"] += 1
+                
+                # حدث البيانات
+                if updates:
+                    frappe.db.set_value("Service Task", task.name, updates, update_modified=False)
+                        
+            except Exception as e:
+                frappe.log_error(f"Error fixing task {task.name}: {str(e)}")
+    
     # إصلاح المشاريع الأسبوعية
     projects = frappe.get_all("Service Project",
         filters={"schedule_type": "Weekly"},
@@ -798,7 +836,7 @@ def fix_remaining_issues():
 def fix_specific_tasks(task_names=None):
     """إصلاح مهام محددة"""
     from service_planner.utils.timezone_utils import tz_manager
-    import pytz
+    from collections import defaultdict
     
     if not task_names:
         # المهام من الفحص
@@ -806,6 +844,7 @@ def fix_specific_tasks(task_names=None):
     
     fixed = []
     errors = []
+    tasks_by_timezone = defaultdict(list)
     
     for task_name in task_names:
         try:
@@ -817,27 +856,34 @@ def fix_specific_tasks(task_names=None):
                 errors.append(f"Task {task_name} not found")
                 continue
             
-            # جلب المشروع
-            project = frappe.get_doc(task_data.parenttype, task_data.parent)
-            user_tz_str = tz_manager.get_user_timezone(project.owner)
-            user_tz = pytz.timezone(user_tz_str)
-            
-            # حساب التواريخ
-            utc_dt = pytz.utc.localize(frappe.utils.get_datetime(task_data.due_date))
-            local_dt = utc_dt.astimezone(user_tz)
-            
-            # تحديث المهمة
-            frappe.db.set_value("Service Task", task_name, {
-                "due_date_utc": task_data.due_date,
-                "user_timezone": str(user_tz_str),
-                "local_due_date": local_dt.replace(tzinfo=None)
-            }, update_modified=False)
-            
-            fixed.append(task_name)
+            # المنطقة الزمنية لصاحب المشروع
+            project_owner = frappe.db.get_value(task_data.parenttype, task_data.parent, "owner")
+            user_tz_str = str(tz_manager.get_user_timezone(project_owner))
+            tasks_by_timezone[user_tz_str].append(task_data)
             
         except Exception as e:
             errors.append(f"Task {task_name}: {str(e)}")
     
+    for user_tz_str, tz_tasks in tasks_by_timezone.items():
+        # حساب التواريخ دفعة واحدة لكل منطقة زمنية
+        local_dts = tz_manager.convert_many_to_local(
+            user_tz_str, [frappe.utils.get_datetime(task.due_date) for task in tz_tasks]
+        )
+        
+        for task_data, local_dt in zip(tz_tasks, local_dts, strict=True):
+            try:
+                # تحديث المهمة
+                frappe.db.set_value("Service Task", task_data.name, {
+                    "due_date_utc": task_data.due_date,
+                    "user_timezone": user_tz_str,
+                    "local_due_date": local_dt.replace(tzinfo=None)
+                }, update_modified=False)
+                
+                fixed.append(task_data.name)
+                
+            except Exception as e:
+                errors.append(f"Task {task_data.name}: {str(e)}")
+    
     frappe.db.commit()
     
     return {
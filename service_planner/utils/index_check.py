@@ -0,0 +1,81 @@
+import frappe
+from datetime import datetime
+from frappe.utils import add_days, getdate, nowdate
+
+# EXPLAIN access types that read every row of the table
+FULL_SCAN_TYPES = ("ALL",)
+
+
+def get_hot_queries(user=None):
+    """
+    استعلامات `tabService Task` كما تبنيها نقاط النهاية نفسها، مع قيم تجريبية
+
+    Every query comes from the builder or constant the endpoint runs, so the
+    check follows the endpoints when their SQL changes.
+    """
+    from service_planner.api.task_api import (
+        UPCOMING_TASKS_QUERY, USER_STATS_QUERY, TaskAPI, build_reminders_query, build_suggest_query,
+        build_task_page_query
+    )
+    from service_planner.server_script.auto_generate_tasks import get_tail_task_filters
+    from service_planner.server_script.task_notifications import (
+        REMINDER_TASK_FIELDS, get_digest_window, get_due_task_filters, get_reminder_window
+    )
+
+    task_api = TaskAPI(user)
+    today = nowdate()
+    now_utc = datetime.utcnow()
+    window_start, window_end = get_reminder_window(now_utc)
+    project = frappe.db.get_value("Service Project", {}, "name") or ""
+    after = (now_utc, "")
+
+    def get_all_query(filters):
+        # run=0: the SQL frappe.get_all would execute
+        return frappe.get_all("Service Task", filters=filters, fields=REMINDER_TASK_FIELDS, run=0)
+
+    return {
+        "get_my_tasks": (build_task_page_query(task_api), None),
+        "get_my_tasks (status, week)": (build_task_page_query(task_api, "Pending", "week"), None),
+        "get_my_tasks (next page)": (build_task_page_query(task_api, after=after), None),
+        "search_tasks": (build_task_page_query(task_api, search_term="task"), None),
+        "suggest_tasks": (build_suggest_query(task_api, "task"), None),
+        "get_dashboard_data": (UPCOMING_TASKS_QUERY, (today,)),
+        "get_user_performance": (USER_STATS_QUERY, (today, task_api.current_user)),
+        "get_task_reminders": (build_reminders_query(task_api), (today, add_days(today, 1))),
+        "notify_scheduled_tasks": (get_all_query(get_due_task_filters(window_start, window_end)), None),
+        "send_daily_digests": (get_all_query(get_due_task_filters(*get_digest_window(now_utc))), None),
+        "project tail tasks": (get_all_query(get_tail_task_filters(project, getdate(today))), None),
+    }
+
+
+def explain_query(query, values=None):
+    return frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+
+
+def check_service_task_indexes(user=None):
+    """
+    تشغيل EXPLAIN على كل استعلام وتحديد ما يقرأ الجدول كاملاً
+
+    bench --site <site> execute service_planner.utils.index_check.check_service_task_indexes
+    """
+    results = []
+    for name, (query, values) in get_hot_queries(user).items():
+        for row in explain_query(query, values):
+            if row.get("table") != "tabService Task":
+                continue
+            results.append({
+                "query": name,
+                "type": row.get("type"),
+                "key": row.get("key"),
+                "rows": row.get("rows"),
+                "full_scan": row.get("type") in FULL_SCAN_TYPES,
+            })
+
+    full_scans = [result["query"] for result in results if result["full_scan"]]
+    if full_scans:
+        frappe.log_error(
+            f"Service Task queries without an index: {', '.join(full_scans)}",
+            "Service Task Index Check"
+        )
+
+    return results
@@ -0,0 +1,143 @@
+import calendar
+from collections.abc import Iterator
+from datetime import date, timedelta
+
+from frappe.utils import getdate
+
+# Monday = bit 0 ... Sunday = bit 6 (same order as date.weekday())
+WEEKDAY_BITS = {name: 1 << index for index, name in enumerate(calendar.day_name)}
+
+
+def weekday_mask(days) -> int:
+    """Build a weekday bitmask from day names or `Week Day` child rows."""
+    mask = 0
+    for day in days or []:
+        name = day if isinstance(day, str) else getattr(day, "day", None)
+        mask |= WEEKDAY_BITS.get(name, 0)
+    return mask
+
+
+class RecurrenceRule:
+    """Closed-form expansion of a Service Project schedule.
+
+    Every schedule is reduced to a periodic pattern anchored at `start_date`:
+    Daily and Every X Days are arithmetic progressions, Weekly is a 7-day
+    period with the selected weekdays stored as a bitmask. Counting and
+    indexing are O(1), so iterating a window costs time proportional to the
+    number of occurrences it returns, not to the number of days it spans.
+    """
+
+    def __init__(
+        self,
+        schedule_type: str,
+        start_date,
+        end_date=None,
+        interval_days: int = 1,
+        weekday_mask: int = 0,
+    ):
+        self.schedule_type = schedule_type
+        self.start = getdate(start_date) if start_date else None
+        self.end = getdate(end_date) if end_date else None
+
+        self.step = 0
+        self.offsets: list[int] = []
+
+        if not self.start:
+            return
+
+        if schedule_type == "Daily":
+            self.step = 1
+            self.offsets = [0]
+        elif schedule_type == "Every X Days":
+            self.step = max(1, int(interval_days or 1))
+            self.offsets = [0]
+        elif schedule_type == "Weekly" and weekday_mask:
+            # Rotate the mask so that offset 0 is the weekday of start_date
+            first_weekday = self.start.weekday()
+            self.step = 7
+            self.offsets = [
+                offset for offset in range(7)
+                if weekday_mask & (1 << ((first_weekday + offset) % 7))
+            ]
+
+        # prefix[r] = number of occurrences within the first r days of a period
+        self._prefix = [0] * (self.step + 1)
+        for offset in self.offsets:
+            for r in range(offset + 1, self.step + 1):
+                self._prefix[r] += 1
+
+    @classmethod
+    def from_doc(cls, doc) -> "RecurrenceRule":
+        """Build the rule from a Service Project document (or any object with the same fields)."""
+        return cls(
+            doc.schedule_type,
+            doc.start_date,
+            doc.end_date,
+            interval_days=getattr(doc, "interval_days", None) or 1,
+            weekday_mask=weekday_mask(getattr(doc, "weekly_days", None)),
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.offsets or (self.end is not None and self.end < self.start)
+
+    @property
+    def per_period(self) -> int:
+        return len(self.offsets)
+
+    def _count_until(self, day: date) -> int:
+        """Number of occurrences in [start, day], ignoring end_date."""
+        if self.is_empty or day < self.start:
+            return 0
+        periods, remainder = divmod((day - self.start).days + 1, self.step)
+        return periods * self.per_period + self._prefix[remainder]
+
+    def nth(self, n: int) -> date | None:
+        """Return the n-th occurrence (0-based) or None if it lies past end_date."""
+        if self.is_empty or n < 0:
+            return None
+        periods, index = divmod(n, self.per_period)
+        occurrence = self.start + timedelta(days=periods * self.step + self.offsets[index])
+        if self.end and occurrence > self.end:
+            return None
+        return occurrence
+
+    def count_between(self, from_date=None, to_date=None) -> int:
+        """Count occurrences in the inclusive window [from_date, to_date].
+
+        An open `to_date` is only allowed when the rule itself has an end date.
+        """
+        if self.is_empty:
+            return 0
+        lower = max(getdate(from_date), self.start) if from_date else self.start
+        upper = getdate(to_date) if to_date else self.end
+        if upper is None:
+            raise ValueError("Cannot count occurrences of an open-ended schedule without an upper bound")
+        if self.end:
+            upper = min(upper, self.end)
+        if upper < lower:
+            return 0
+        return self._count_until(upper) - self._count_until(lower - timedelta(days=1))
+
+    def index_of_first_on_or_after(self, day) -> int:
+        """Index of the first occurrence falling on or after `day`."""
+        day = getdate(day)
+        return self._count_until(day - timedelta(days=1))
+
+    def iter_dates(self, from_date=None, to_date=None, limit: int | None = None) -> Iterator[date]:
+        """Lazily yield occurrences in [from_date, to_date], at most `limit` of them."""
+        if self.is_empty:
+            return
+        upper = getdate(to_date) if to_date else None
+        n = self.index_of_first_on_or_after(from_date) if from_date else 0
+        produced = 0
+        while limit is None or produced < limit:
+            occurrence = self.nth(n)
+            if occurrence is None or (upper and occurrence > upper):
+                return
+            yield occurrence
+            produced += 1
+            n += 1
+
+    def dates_between(self, from_date=None, to_date=None, limit: int | None = None) -> list[date]:
+        return list(self.iter_dates(from_date, to_date, limit))
@@ -0,0 +1,119 @@
+from collections.abc import Iterable
+
+import frappe
+
+# Redis hashes shared by every worker of the site:
+#   role -> enabled users holding it
+#   user -> {"roles", "enabled", "email", "organization"}
+ROLE_MEMBERS_CACHE_KEY = "service_planner:role_members"
+USER_INFO_CACHE_KEY = "service_planner:user_info"
+
+# Roles every signed-in user has, as returned by frappe.get_roles
+AUTOMATIC_ROLES = ("All", "Guest")
+
+
+def get_role_members(roles: Iterable[str]) -> dict[str, list[str]]:
+    """المستخدمون المفعلون لكل دور (من الذاكرة المؤقتة، واستعلام واحد للأدوار الناقصة)"""
+    members = {}
+    missing = []
+    for role in set(roles or ()):
+        if not role:
+            continue
+        cached = frappe.cache.hget(ROLE_MEMBERS_CACHE_KEY, role)
+        if cached is None:
+            missing.append(role)
+        else:
+            members[role] = cached
+
+    if missing:
+        loaded = {role: [] for role in missing}
+        for row in frappe.db.sql("""
+            SELECT DISTINCT has_role.role, has_role.parent
+            FROM `tabHas Role` has_role
+            INNER JOIN `tabUser` user ON user.name = has_role.parent
+            WHERE has_role.parenttype = 'User'
+                AND has_role.role IN %(roles)s
+                AND user.enabled = 1
+        """, {"roles": missing}, as_dict=True):
+            loaded[row.role].append(row.parent)
+
+        for role, users in loaded.items():
+            frappe.cache.hset(ROLE_MEMBERS_CACHE_KEY, role, users)
+        members.update(loaded)
+
+    return members
+
+
+def get_users_info(users: Iterable[str]) -> dict[str, frappe._dict]:
+    """أدوار المستخدمين وبريدهم ومؤسستهم (من الذاكرة المؤقتة؛ المناطق الزمنية في timezone_utils)"""
+    info = {}
+    missing = []
+    for user in set(users or ()):
+        if not user:
+            continue
+        cached = frappe.cache.hget(USER_INFO_CACHE_KEY, user)
+        if cached is None:
+            missing.append(user)
+        else:
+            info[user] = frappe._dict(cached)
+
+    if missing:
+        loaded = {}
+        for row in frappe.get_all(
+            "User",
+            filters={"name": ["in", missing]},
+            fields=["name", "enabled", "email", "organization"]
+        ):
+            loaded[row.name] = {
+                "roles": list(AUTOMATIC_ROLES),
+                "enabled": row.enabled,
+                "email": row.email,
+                "organization": row.organization,
+            }
+
+        for row in frappe.get_all(
+            "Has Role",
+            filters={"parenttype": "User", "parent": ["in", list(loaded)]},
+            fields=["parent", "role"]
+        ) if loaded else []:
+            if row.role not in loaded[row.parent]["roles"]:
+                loaded[row.parent]["roles"].append(row.role)
+
+        for user, user_info in loaded.items():
+            frappe.cache.hset(USER_INFO_CACHE_KEY, user, user_info)
+            info[user] = frappe._dict(user_info)
+
+    return info
+
+
+def get_user_info(user: str) -> frappe._dict:
+    return get_users_info([user]).get(user) or frappe._dict(
+        roles=[], enabled=0, email=None, organization=None
+    )
+
+
+def get_user_roles(user: str | None = None) -> list[str]:
+    """بديل frappe.get_roles مبني على الفهرس المشترك"""
+    user = user or frappe.session.user
+    if user in ("Administrator", "Guest"):
+        # Administrator has every role and Guest only "Guest"; frappe resolves both without queries
+        return frappe.get_roles(user)
+    return get_user_info(user).roles
+
+
+def clear_role_index(users: Iterable[str] | None = None):
+    """مسح الفهرس: الأعضاء لكل الأدوار، ومعلومات المستخدمين المحددين (أو الجميع)"""
+    frappe.cache.delete_value(ROLE_MEMBERS_CACHE_KEY)
+    if users is None:
+        frappe.cache.delete_value(USER_INFO_CACHE_KEY)
+        return
+    for user in users:
+        frappe.cache.hdel(USER_INFO_CACHE_KEY, user)
+
+
+def on_user_change(doc, method=None):
+    """doc_events hook لـ User و Has Role"""
+    user = doc.parent if doc.doctype == "Has Role" else doc.name
+    if doc.doctype == "Has Role" and doc.parenttype != "User":
+        return
+    clear_role_index([user])
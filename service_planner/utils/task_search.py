@@ -0,0 +1,70 @@
+import re
+
+import frappe
+from frappe.utils import strip_html
+
+# FULLTEXT index over the title and the plain text of the notes (notes is HTML)
+SEARCH_INDEX_NAME = "task_search_index"
+SEARCH_FIELDS = ("task_title", "notes_text")
+
+# Words of the search term; boolean operators and punctuation are dropped
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+MAX_SEARCH_TOKENS = 8
+
+DEFAULT_SUGGESTION_LIMIT = 10
+MAX_SUGGESTION_LIMIT = 50
+
+
+def get_notes_text(notes: str | None) -> str | None:
+    """نص الملاحظات بدون HTML ومسافات زائدة (للفهرسة)"""
+    if not notes:
+        return None
+    return " ".join(strip_html(notes).split()) or None
+
+
+def add_task_search_index():
+    """إنشاء فهرس FULLTEXT إن لم يكن موجوداً"""
+    if frappe.db.has_index("tabService Task", SEARCH_INDEX_NAME):
+        return
+    frappe.db.sql_ddl(
+        f"ALTER TABLE `tabService Task` ADD FULLTEXT INDEX `{SEARCH_INDEX_NAME}` "
+        f"({', '.join(SEARCH_FIELDS)})"
+    )
+
+
+def get_search_tokens(search_term: str) -> list[str]:
+    tokens = SEARCH_TOKEN_PATTERN.findall((search_term or "").lower())
+    return list(dict.fromkeys(tokens))[:MAX_SEARCH_TOKENS]
+
+
+def get_match_expression(search_term: str) -> str | None:
+    """
+    MATCH ... AGAINST في الوضع المنطقي: كل كلمة مطلوبة وتطابق كبادئة (للبحث أثناء الكتابة)
+
+    Returns None when the term has no searchable words. A word with the `*`
+    operator is kept even when shorter than innodb_ft_min_token_size.
+    """
+    tokens = get_search_tokens(search_term)
+    if not tokens:
+        return None
+    query = " ".join(f"+{token}*" for token in tokens)
+    return f"MATCH({', '.join(SEARCH_FIELDS)}) AGAINST ({frappe.db.escape(query)} IN BOOLEAN MODE)"
+
+
+def get_search_condition(search_term: str) -> str:
+    """شرط WHERE للبحث؛ المصطلح بلا كلمات (رموز فقط) يبحث في العنوان"""
+    return get_match_expression(search_term) or \
+        f"task_title LIKE {frappe.db.escape(f'%{search_term}%')}"
+
+
+def matches_search(search_term: str, *texts) -> bool:
+    """نفس قواعد البحث للمهام غير المحفوظة (virtual): كل كلمة بادئة لكلمة في النص"""
+    tokens = get_search_tokens(search_term)
+    if not tokens:
+        term = (search_term or "").lower()
+        return any(term in (text or "").lower() for text in texts)
+
+    words = set()
+    for text in texts:
+        words.update(SEARCH_TOKEN_PATTERN.findall(strip_html(text or "").lower()))
+    return all(any(word.startswith(token) for word in words) for token in tokens)
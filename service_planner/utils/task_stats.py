@@ -0,0 +1,85 @@
+from collections.abc import Callable, Iterable
+
+import frappe
+from frappe.utils import nowdate
+
+from service_planner.utils.role_index import get_role_members
+
+# One Redis hash per user and day: "<status>|<due_filter>" -> stats
+# The date is part of the key because "overdue" moves at midnight; each day's
+# hash expires on its own once it is no longer read.
+TASK_STATS_CACHE_PREFIX = "service_planner:task_stats:"
+TASK_STATS_CACHE_TTL = 2 * 24 * 60 * 60
+
+# Users who see every task (TaskAPI.is_admin)
+ADMIN_ROLES = ("System Manager", "Administrator")
+
+EMPTY_STATS = {"total": 0, "completed": 0, "in_progress": 0, "pending": 0, "overdue": 0}
+
+
+def _cache_key(user):
+    return f"{TASK_STATS_CACHE_PREFIX}{user}:{nowdate()}"
+
+
+def _stats_field(status=None, due_filter=None):
+    return f"{status or 'All'}|{due_filter or 'all'}"
+
+
+def get_cached_task_stats(user: str, status=None, due_filter=None, compute: Callable[[], dict] | None = None) -> dict:
+    """إحصائيات المستخدم لهذا الفلتر من الذاكرة المؤقتة، أو حسابها وتخزينها"""
+    field = _stats_field(status, due_filter)
+    stats = frappe.cache.hget(_cache_key(user), field)
+    if stats is None:
+        stats = compute()
+        frappe.cache.hset(_cache_key(user), field, stats)
+        frappe.cache.expire(frappe.cache.make_key(_cache_key(user)), TASK_STATS_CACHE_TTL)
+    return stats
+
+
+def get_affected_users(tasks: Iterable) -> set:
+    """المستخدمون الذين تظهر لهم هذه المهام: المعين، أعضاء الدور، والمدراء"""
+    users = {"Administrator"}
+    roles = set(ADMIN_ROLES)
+    for task in tasks:
+        if not task:
+            continue
+        if task.get("assigned_to"):
+            users.add(task.get("assigned_to"))
+        if task.get("assigned_role"):
+            roles.add(task.get("assigned_role"))
+
+    for members in get_role_members(roles).values():
+        users.update(members)
+    return users
+
+
+def invalidate_task_stats(tasks: Iterable):
+    """مسح إحصائيات المستخدمين المتأثرين فقط (قبل التعديل وبعده)"""
+    users = get_affected_users(tasks)
+    frappe.cache.delete_value([_cache_key(user) for user in users])
+
+
+def clear_task_stats(users: Iterable[str]):
+    frappe.cache.delete_value([_cache_key(user) for user in users])
+
+
+def on_task_change(doc, method=None):
+    """doc_events hook لـ Service Task"""
+    invalidate_task_stats([doc, doc.get_doc_before_save()])
+
+
+def on_project_change(doc, method=None):
+    """doc_events hook لـ Service Project: صفوف المهام تُحفظ مع المشروع بدون أحداث خاصة بها"""
+    before = doc.get_doc_before_save()
+    tasks = list(doc.get("service_tasks") or [])
+    if before:
+        tasks.extend(before.get("service_tasks") or [])
+    tasks.append({"assigned_role": doc.get("default_role")})
+    invalidate_task_stats(tasks)
+
+
+def on_user_change(doc, method=None):
+    """doc_events hook لـ User و Has Role: تغيير الأدوار يغير نطاق المهام"""
+    if doc.doctype == "Has Role" and doc.parenttype != "User":
+        return
+    clear_task_stats([doc.parent if doc.doctype == "Has Role" else doc.name])
@@ -0,0 +1,89 @@
+import unittest
+from datetime import date, timedelta
+
+from service_planner.utils.recurrence import RecurrenceRule, weekday_mask
+
+# Schedules crossing month ends, the 2024 leap day and a year end
+RULES = [
+    ("Daily", date(2023, 12, 27), date(2024, 3, 3), 1, []),
+    ("Every X Days", date(2024, 1, 30), date(2025, 1, 10), 3, []),
+    ("Every X Days", date(2023, 12, 31), date(2024, 12, 31), 10, []),
+    ("Weekly", date(2024, 2, 26), date(2025, 1, 5), 1, ["Monday", "Thursday", "Sunday"]),
+    ("Weekly", date(2023, 12, 30), date(2024, 3, 2), 1, ["Saturday"]),
+    ("Weekly", date(2024, 12, 31), date(2025, 2, 1), 1, ["Tuesday", "Wednesday", "Friday"]),
+]
+
+
+def expand(schedule_type, start, end, interval_days, days):
+    """Day-by-day expansion of the same schedule, as a reference."""
+    mask = weekday_mask(days)
+    dates = []
+    day = start
+    while day <= end:
+        offset = (day - start).days
+        if schedule_type == "Daily":
+            matches = True
+        elif schedule_type == "Every X Days":
+            matches = offset % interval_days == 0
+        else:
+            matches = bool(mask & (1 << day.weekday()))
+        if matches:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def sample_windows(start, end):
+    """Windows starting before, inside and after the schedule, across month and year ends."""
+    bounds = [start - timedelta(days=3), start, date(2024, 1, 1), date(2024, 2, 28), date(2024, 2, 29),
+              date(2024, 3, 1), date(2024, 12, 31), date(2025, 1, 1), end, end + timedelta(days=5)]
+    return [(lower, upper) for lower in bounds for upper in bounds]
+
+
+class TestRecurrenceRule(unittest.TestCase):
+    def rule(self, schedule_type, start, end, interval_days, days):
+        return RecurrenceRule(schedule_type, start, end, interval_days=interval_days, weekday_mask=weekday_mask(days))
+
+    def test_nth_matches_expansion(self):
+        for spec in RULES:
+            rule = self.rule(*spec)
+            expected = expand(*spec)
+            with self.subTest(spec=spec):
+                self.assertEqual([rule.nth(n) for n in range(len(expected))], expected)
+                self.assertIsNone(rule.nth(len(expected)))
+                self.assertIsNone(rule.nth(-1))
+
+    def test_count_between_matches_expansion(self):
+        for spec in RULES:
+            rule = self.rule(*spec)
+            expected = expand(*spec)
+            for lower, upper in sample_windows(spec[1], spec[2]):
+                with self.subTest(spec=spec, lower=lower, upper=upper):
+                    self.assertEqual(
+                        rule.count_between(lower, upper),
+                        len([day for day in expected if lower <= day <= upper])
+                    )
+
+    def test_iter_dates_matches_expansion(self):
+        for spec in RULES:
+            rule = self.rule(*spec)
+            expected = expand(*spec)
+            for lower, upper in sample_windows(spec[1], spec[2]):
+                window = [day for day in expected if lower <= day <= upper]
+                with self.subTest(spec=spec, lower=lower, upper=upper):
+                    self.assertEqual(list(rule.iter_dates(lower, upper)), window)
+                    self.assertEqual(rule.dates_between(lower, upper, limit=4), window[:4])
+
+    def test_open_ended_rule(self):
+        rule = RecurrenceRule("Every X Days", date(2024, 12, 30), interval_days=2)
+        self.assertEqual(
+            rule.dates_between(date(2024, 12, 31), limit=3),
+            [date(2025, 1, 1), date(2025, 1, 3), date(2025, 1, 5)]
+        )
+        with self.assertRaises(ValueError):
+            rule.count_between(date(2025, 1, 1))
+
+    def test_empty_rules(self):
+        self.assertTrue(RecurrenceRule("Weekly", date(2024, 1, 1), date(2024, 2, 1)).is_empty)
+        self.assertTrue(RecurrenceRule("Daily", date(2024, 2, 1), date(2024, 1, 1)).is_empty)
+        self.assertEqual(RecurrenceRule("Custom", date(2024, 1, 1)).dates_between(limit=5), [])
@@ -1,13 +1,11 @@
 import frappe
 from frappe.utils import get_datetime
 import pytz
+from service_planner.utils.timezone_utils import tz_manager
 
 def get_user_timezone():
     """Get user's timezone"""
-    user_tz = frappe.db.get_value("User", frappe.session.user, "time_zone")
-    if not user_tz:
-        user_tz = frappe.utils.get_time_zone()
-    return pytz.timezone(user_tz)
+    return tz_manager.get_user_timezone(frappe.session.user)
 
 def convert_to_utc(local_dt):
     """Convert local datetime to UTC"""
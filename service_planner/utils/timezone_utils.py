@@ -1,36 +1,168 @@
 import frappe
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from time import monotonic
+from frappe.utils import cint
 import pytz
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+
+class TransitionTable:
+    """جدول انتقالات التوقيت الصيفي لمنطقة زمنية واحدة
+
+    Built once per timezone from pytz's transition data. Local datetimes that fall
+    between two transitions share one offset, so whole runs of dates are converted
+    with plain arithmetic. Local times inside a transition window (ambiguous or
+    non-existent) are delegated to `tz.localize`, so results always match pytz.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        utc_times = getattr(tz, "_utc_transition_times", None)
+        infos = getattr(tz, "_transition_info", None)
+        self.is_static = not utc_times or not infos
+
+        if self.is_static:
+            return
+
+        self.utc_times = utc_times
+        self.tzinfos = [tz._tzinfos[info] for info in infos]
+        self.offsets = [info[0] for info in infos]
+
+        # Segment i is safe for local times in [safe_from[i], unsafe_from[i + 1])
+        self.safe_from = [datetime.min]
+        self.unsafe_from = [datetime.min]
+        for i in range(1, len(utc_times)):
+            before, after = self.offsets[i - 1], self.offsets[i]
+            self.safe_from.append(utc_times[i] + max(before, after))
+            self.unsafe_from.append(utc_times[i] + min(before, after))
+        self.unsafe_from.append(datetime.max)
+
+    def localize_many(self, naive_dts: List[datetime]) -> List[datetime]:
+        if self.is_static:
+            return [self.tz.localize(dt) for dt in naive_dts]
+
+        result = []
+        segment = 0
+        last = len(self.safe_from) - 1
+        for dt in naive_dts:
+            # Sorted input walks forward; anything else falls back to a binary search
+            if not (self.safe_from[segment] <= dt and (segment == last or dt < self.safe_from[segment + 1])):
+                segment = bisect_right(self.safe_from, dt) - 1
+
+            if dt >= self.unsafe_from[segment + 1]:
+                # Ambiguous or non-existent local time: keep pytz semantics
+                result.append(self.tz.localize(dt))
+            else:
+                result.append(dt.replace(tzinfo=self.tzinfos[segment]))
+        return result
+
+    def from_utc_many(self, utc_dts: List[datetime]) -> List[datetime]:
+        if self.is_static:
+            return [pytz.utc.localize(dt).astimezone(self.tz) for dt in utc_dts]
+
+        result = []
+        for dt in utc_dts:
+            segment = max(0, bisect_right(self.utc_times, dt) - 1)
+            tzinfo = self.tzinfos[segment]
+            result.append((dt + self.offsets[segment]).replace(tzinfo=tzinfo))
+        return result
+
+
+# Redis hash holding the explicit `time_zone` of each user ("" when unset)
+USER_TIMEZONE_CACHE_KEY = "service_planner:user_timezone"
+
+# In-process tier: bounded LRU whose entries expire so that changes made through
+# another worker are picked up; override with "service_planner_timezone_cache_ttl"
+LOCAL_TIMEZONE_CACHE_SIZE = 1024
+DEFAULT_LOCAL_TIMEZONE_CACHE_TTL = 60
+
 
 class TimezoneManager:
+    """إدارة المناطق الزمنية
+
+    Safe to create at import time: nothing is read until first use, and cached
+    user timezones are keyed by site so one process can serve several sites.
+    """
+
     def __init__(self):
         self.utc = pytz.UTC
-        self.cache = {}
+        self.cache = OrderedDict()
         self._default_timezone = "UTC"
-        
-    def get_user_timezone(self, user: Optional[str] = None) -> pytz.timezone:
-        """الحصول على المنطقة الزمنية للمستخدم"""
+        self._transition_tables = {}
+
+    def get_system_timezone(self) -> str:
+        """المنطقة الزمنية للنظام"""
+        try:
+            return frappe.utils.get_system_timezone() or self._default_timezone
+        except Exception:
+            return self._default_timezone
+
+    def _cache_key(self, user: str):
+        return (getattr(frappe.local, "site", None), user)
+
+    def _get_cached_user_timezone(self, user: str) -> Optional[str]:
+        key = self._cache_key(user)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        user_tz, expires_at = entry
+        if expires_at < monotonic():
+            del self.cache[key]
+            return None
+
+        self.cache.move_to_end(key)
+        return user_tz
+
+    def _set_cached_user_timezone(self, user: str, user_tz: str):
+        key = self._cache_key(user)
+        ttl = cint(frappe.conf.get("service_planner_timezone_cache_ttl", DEFAULT_LOCAL_TIMEZONE_CACHE_TTL))
+        self.cache[key] = (user_tz, monotonic() + ttl)
+        self.cache.move_to_end(key)
+        while len(self.cache) > LOCAL_TIMEZONE_CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def get_user_timezone_name(self, user: Optional[str] = None, default: Optional[str] = None) -> str:
+        """اسم المنطقة الزمنية للمستخدم
+
+        Looked up in the in-process LRU, then in the shared `frappe.cache` hash,
+        and only then in `tabUser`. Users without a timezone get `default`, or
+        the system one when no default is given.
+        """
         if not user:
             user = frappe.session.user
-            
-        cache_key = f"timezone_{user}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
-            
+
+        user_tz = self._get_cached_user_timezone(user)
+        if user_tz is None:
+            try:
+                user_tz = frappe.cache.hget(USER_TIMEZONE_CACHE_KEY, user)
+                if user_tz is None:
+                    user_tz = frappe.db.get_value("User", user, "time_zone") or ""
+                    frappe.cache.hset(USER_TIMEZONE_CACHE_KEY, user, user_tz)
+            except Exception as e:
+                frappe.log_error(f"Error getting user timezone: {str(e)}")
+                return self.get_system_timezone() if default is None else default
+
+            self._set_cached_user_timezone(user, user_tz)
+
+        if user_tz:
+            return user_tz
+        return self.get_system_timezone() if default is None else default
+
+    def get_user_timezone(self, user: Optional[str] = None) -> pytz.timezone:
+        """الحصول على المنطقة الزمنية للمستخدم"""
         try:
-            # محاولة الحصول على المنطقة الزمنية من إعدادات المستخدم
-            user_tz = frappe.db.get_value("User", user, "time_zone")
-            if not user_tz:
-                user_tz = frappe.utils.get_time_zone() or self._default_timezone
-                
-            timezone = pytz.timezone(user_tz)
-            self.cache[cache_key] = timezone
-            return timezone
-            
+            return pytz.timezone(self.get_user_timezone_name(user))
         except Exception as e:
             frappe.log_error(f"Error getting user timezone: {str(e)}")
             return pytz.timezone(self._default_timezone)
+
+    def invalidate_user_timezone(self, user: str):
+        """حذف المنطقة الزمنية للمستخدم من الذاكرة المؤقتة"""
+        self.cache.pop(self._cache_key(user), None)
+        frappe.cache.hdel(USER_TIMEZONE_CACHE_KEY, user)
     
     def convert_to_utc(self, local_dt: datetime, source_tz: Optional[pytz.timezone] = None) -> datetime:
         """تحويل التوقيت المحلي إلى UTC"""
@@ -62,6 +194,35 @@ class TimezoneManager:
             frappe.log_error(f"Error converting to local time: {str(e)}")
             return utc_dt
     
+    def get_transition_table(self, tz) -> TransitionTable:
+        """جدول الانتقالات (محفوظ لكل منطقة زمنية)"""
+        if isinstance(tz, str):
+            tz = pytz.timezone(tz)
+
+        key = str(tz)
+        table = self._transition_tables.get(key)
+        if table is None:
+            table = self._transition_tables[key] = TransitionTable(tz)
+        return table
+
+    def localize_many(self, tz, naive_dts: List[datetime]) -> List[datetime]:
+        """تحويل مجموعة أوقات محلية (مرتبة) إلى أوقات aware دفعة واحدة
+
+        Same result as `[tz.localize(dt) for dt in naive_dts]`.
+        """
+        return self.get_transition_table(tz).localize_many(naive_dts)
+
+    def convert_many_to_utc(self, tz, naive_dts: List[datetime]) -> List[datetime]:
+        """تحويل أوقات محلية إلى UTC (بدون tzinfo) للتخزين"""
+        return [
+            dt.astimezone(self.utc).replace(tzinfo=None)
+            for dt in self.localize_many(tz, naive_dts)
+        ]
+
+    def convert_many_to_local(self, tz, utc_dts: List[datetime]) -> List[datetime]:
+        """تحويل أوقات UTC (بدون tzinfo) إلى التوقيت المحلي دفعة واحدة"""
+        return self.get_transition_table(tz).from_utc_many(utc_dts)
+
     def format_datetime(self, dt: datetime, timezone: Optional[pytz.timezone] = None, 
                        format_str: str = "%Y-%m-%d %H:%M:%S %Z") -> str:
         """تنسيق التاريخ والوقت"""
@@ -108,6 +269,13 @@ class TimezoneManager:
     def clear_cache(self):
         """مسح الذاكرة المؤقتة"""
         self.cache.clear()
+        frappe.cache.delete_value(USER_TIMEZONE_CACHE_KEY)
 
 # إنشاء نسخة عامة
 tz_manager = TimezoneManager()
+
+
+def on_user_update(doc, method=None):
+    """إبطال الذاكرة المؤقتة عند تغيير المنطقة الزمنية للمستخدم"""
+    if method == "on_trash" or doc.has_value_changed("time_zone"):
+        tz_manager.invalidate_user_timezone(doc.name)